@@ -101,8 +101,13 @@ def test_10_check_cleanup():
     dirty_hosts = dict()
     errors = []
 
-    dirty_hosts["httpd"] = [cds.hostname for cds in CDS if Helpers.check_service(cds, service)]
-    dirty_hosts["mount"] = [cds.hostname for cds in CDS if Helpers.check_mountpoint(cds, mdir)]
+    results = ConMgr.fan_out(CDS_HOSTNAMES,
+                             lambda cds: Helpers.check_service_and_mountpoint(cds, service, mdir))
+    for res in results:
+        if res.error:
+            raise res.error
+    dirty_hosts["httpd"] = [res.hostname for res in results if res.result[0]]
+    dirty_hosts["mount"] = [res.hostname for res in results if res.result[1]]
 
     if dirty_hosts["httpd"]:
         errors.append("Apache is still running on %s" % dirty_hosts["httpd"])
@@ -68,15 +68,24 @@ def test_01_rhua_check_sos_script():
     '''
     Sos.check_rhui_sos_script(CONNECTION_RHUA)
 
-def test_02_rhua_sosreport_run():
+def test_02_cds_check_sos_script():
     '''
-        run sosreport on the RHUA node
+        check if the RHUI sosreport script is available on the CDS node
+    '''
+    # for RHBZ#1596296
+    Sos.check_rhui_sos_script(CONNECTION_CDS)
+
+def test_03_sosreport_run():
     '''
-    sosreport_location = Sos.run(CONNECTION_RHUA)
+        run sosreport on the RHUA and CDS nodes in parallel
+    '''
+    locations = Sos.run_on_all([CONNECTION_RHUA.hostname, CONNECTION_CDS.hostname])
     with open(SOSREPORT_LOCATION_RHUA, "w") as location:
-        location.write(sosreport_location)
+        location.write(locations[CONNECTION_RHUA.hostname])
+    with open(SOSREPORT_LOCATION_CDS, "w") as location:
+        location.write(locations[CONNECTION_CDS.hostname])
 
-def test_03_rhua_sosreport_check():
+def test_04_rhua_sosreport_check():
     '''
         check if the sosreport archive from the RHUA node contains the desired files
     '''
@@ -84,22 +93,7 @@ def test_03_rhua_sosreport_check():
         sosreport_location = location.read()
     Sos.check_files_in_archive(CONNECTION_RHUA, WANTED_FILES_RHUA, sosreport_location)
 
-def test_04_cds_check_sos_script():
-    '''
-        check if the RHUI sosreport script is available on the CDS node
-    '''
-    # for RHBZ#1596296
-    Sos.check_rhui_sos_script(CONNECTION_CDS)
-
-def test_05_cds_sosreport_run():
-    '''
-        run sosreport on the CDS node
-    '''
-    sosreport_location = Sos.run(CONNECTION_CDS)
-    with open(SOSREPORT_LOCATION_CDS, "w") as location:
-        location.write(sosreport_location)
-
-def test_06_cds_sosreport_check():
+def test_05_cds_sosreport_check():
     '''
         check if the sosreport archive from the CDS node contains the desired files
     '''
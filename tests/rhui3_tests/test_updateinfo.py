@@ -22,6 +22,7 @@ from rhui3_tests_lib.rhuimanager_client import RHUIManagerClient
 from rhui3_tests_lib.rhuimanager_cmdline import RHUIManagerCLI
 from rhui3_tests_lib.rhuimanager_instance import RHUIManagerInstance
 from rhui3_tests_lib.rhuimanager_repo import RHUIManagerRepo
+from rhui3_tests_lib.updateinfo import Updateinfo
 from rhui3_tests_lib.util import Util
 
 logging.basicConfig(level=logging.DEBUG)
@@ -174,25 +175,24 @@ class TestClient():
         '''
            check if the all the updates from the original updateinfo file are available from RHUI
         '''
-        errata_pattern = "RH.A-[0-9]*:[0-9]*"
         if self.version <= 7:
             cache = "/var/cache/yum/%s/%sServer/rhui-custom-%s" % \
                     (self.arch, self.version, self.test["repo_id"])
         else:
             cache = "/var/cache/dnf/rhui-custom-%s*/repodata" % self.test["repo_id"]
 
-        _, stdout, _ = RHUA.exec_command("zgrep -o '%s' " % errata_pattern +
-                                         "/tmp/extra_rhui_files/%s/updateinfo.xml.gz " % \
-                                         self.test["repo_id"] +
-                                         "| sort -u")
-        orig_errata = stdout.read().decode().splitlines()
-
-        _, stdout, _ = CLI.exec_command("zgrep -o '%s' " % errata_pattern +
-                                        "%s/*updateinfo.xml.gz " % \
-                                        cache +
-                                        "| sort -u")
-        processed_errata = stdout.read().decode().splitlines()
-        nose.tools.eq_(orig_errata, processed_errata)
+        orig_errata = Updateinfo.from_file(RHUA,
+                                           "/tmp/extra_rhui_files/%s/updateinfo.xml.gz" % \
+                                           self.test["repo_id"])
+
+        _, stdout, _ = CLI.exec_command("ls %s/*updateinfo.xml.gz" % cache)
+        updateinfo_files = stdout.read().decode().split()
+        nose.tools.ok_(updateinfo_files, msg="no updateinfo file in %s on the client" % cache)
+        processed_errata = Updateinfo.from_file(CLI, updateinfo_files[0])
+        nose.tools.eq_(orig_errata.diff(processed_errata), (set(), set()))
+        # the metadata published on the RHUA must have the same errata, too
+        nose.tools.eq_(orig_errata.diff(Updateinfo.from_repo(RHUA, self.test["repo_id"])),
+                       (set(), set()))
 
     def test_13_uncompressed_xml(self):
         '''
@@ -0,0 +1,223 @@
+"""Local Cache of Files Fetched from RHUI Nodes"""
+
+# Files are stored under their SHA-256 checksums, which are obtained on the remote host along with
+# the size, the modification and change times and the inode number in a single command. A file
+# that hasn't changed remotely is therefore only transferred once; the next requests are served
+# from the cache. If none of the stat fields of a remote file have changed since last time, the file
+# isn't even hashed again. The least recently used files are removed when the cache grows beyond
+# its size limit.
+#
+# The cache directory belongs to the user and is only accessible to them, as the files can be
+# sensitive (entitlement certificates, for example). Several processes can share it: files are
+# fetched to temporary files and renamed when complete, a cached file is checked against its
+# checksum before it's used, and files removed by another process are fetched again.
+
+from collections import OrderedDict
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+from rhui3_tests_lib.lines import run_command
+
+CACHE_DIR_ENV = "RHUI_ARTIFACT_CACHE"
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "rhui3_artifacts-%d" % os.getuid())
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+CHUNK_SIZE = 1048576
+
+class RemoteFileError(IOError):
+    """
+    Raised when a remote file cannot be examined or fetched
+    """
+
+class CacheDirectoryError(Exception):
+    """
+    Raised when the cache directory is accessible to other users
+    """
+
+def _private_directory(directory):
+    """create the directory with access for the user only, or check an existing one"""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise CacheDirectoryError("%s isn't a directory owned by the current user" % directory)
+    if stat.S_IMODE(info.st_mode) != 0o700:
+        os.chmod(directory, 0o700)
+
+def _remove(path):
+    """remove a file unless it's already gone"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _open_verified(path, checksum):
+    """open the local file if its checksum is the expected one, return None otherwise"""
+    try:
+        local_file = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: local_file.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    if digest.hexdigest() != checksum:
+        local_file.close()
+        return None
+    local_file.seek(0)
+    return local_file
+
+class ArtifactCache():
+    """a size-limited, content-addressed local file cache"""
+    def __init__(self, directory="", max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory or os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        _private_directory(self.directory)
+        # checksum -> size, least recently used first
+        self._entries = OrderedDict()
+        # (hostname, remote path) -> (size, stat stamp, checksum) seen last time
+        self._fingerprints = {}
+        blobs = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".part"):
+                continue
+            try:
+                info = os.stat(self._path(name))
+            except FileNotFoundError:
+                continue
+            blobs.append((info.st_mtime, name, info.st_size))
+        for _, name, size in sorted(blobs):
+            self._entries[name] = size
+
+    def _path(self, checksum):
+        """the local path to the file with the checksum"""
+        return os.path.join(self.directory, checksum)
+
+    def fingerprint(self, connection, remote_path):
+        """return the size, the stat stamp (times and inode) and the checksum of a remote file"""
+        key = (connection.hostname, remote_path)
+        known = self._fingerprints.get(key, (-1, "", ""))
+        # only compute the checksum if the size or the stamp has changed
+        command = "S=`stat -c '%%s %%Y %%Z %%i' %s` && set -- $S && echo $@ && " % remote_path + \
+                  "{ [ \"$*\" = '%d %s' ] || sha256sum %s; }" % (known[0], known[1], remote_path)
+        status, output, error = run_command(connection, command, 60)
+        if status != 0:
+            raise RemoteFileError("Cannot examine %s on %s: %s" % \
+                                  (remote_path,
+                                   connection.hostname,
+                                   error if status is not None else "timed out"))
+        fields = output.split()
+        size, stamp = int(fields[0]), " ".join(fields[1:4])
+        checksum = fields[4] if len(fields) > 4 else known[2]
+        self._fingerprints[key] = (size, stamp, checksum)
+        return size, stamp, checksum
+
+    @property
+    def size(self):
+        """the total size of the cached files"""
+        return sum(self._entries.values())
+
+    def stats(self):
+        """return a dictionary with the cache statistics"""
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "files": len(self._entries),
+                "size": self.size}
+
+    def _open_cached(self, checksum):
+        """open the intact cached file with the checksum and mark it as used, or return None"""
+        cached_file = _open_verified(self._path(checksum), checksum)
+        with self._lock:
+            if not cached_file:
+                # missing (removed by another process) or damaged
+                if self._entries.pop(checksum, None) is not None:
+                    _remove(self._path(checksum))
+                return None
+            self._entries[checksum] = os.fstat(cached_file.fileno()).st_size
+            self._touch(checksum)
+            self.hits += 1
+        return cached_file
+
+    def _open(self, connection, remote_path):
+        """return the open cached copy of the remote file, fetch it first if needed"""
+        size, _, checksum = self.fingerprint(connection, remote_path)
+        cached_file = self._open_cached(checksum)
+        if cached_file:
+            return cached_file
+        with self._lock:
+            self.misses += 1
+        handle, part_path = tempfile.mkstemp(suffix=".part", dir=self.directory)
+        os.close(handle)
+        try:
+            connection.sftp.get(remote_path, part_path)
+            cached_file = _open_verified(part_path, checksum)
+            if not cached_file:
+                raise RemoteFileError("%s on %s changed while it was being fetched" % \
+                                      (remote_path, connection.hostname))
+            os.replace(part_path, self._path(checksum))
+        finally:
+            _remove(part_path)
+        with self._lock:
+            self._entries[checksum] = size
+            self._entries.move_to_end(checksum)
+            self._evict(checksum)
+        return cached_file
+
+    def lookup(self, connection, remote_path):
+        """return the local path to an up-to-date copy of the remote file, or None"""
+        _, _, checksum = self.fingerprint(connection, remote_path)
+        cached_file = self._open_cached(checksum)
+        if not cached_file:
+            return None
+        cached_file.close()
+        return self._path(checksum)
+
+    def get(self, connection, remote_path):
+        """return the local path to an up-to-date copy of the remote file, fetch it if needed"""
+        self._open(connection, remote_path).close()
+        return self._path(self._fingerprints[(connection.hostname, remote_path)][2])
+
+    def fetch(self, connection, remote_path, local_path):
+        """copy the remote file to the local path (through the cache)"""
+        # the copy is made from the open file, so it works even if another process removes it
+        with self._open(connection, remote_path) as cached_file, \
+             open(local_path, "wb") as local_file:
+            shutil.copyfileobj(cached_file, local_file, CHUNK_SIZE)
+
+    def clear(self):
+        """remove all cached files"""
+        with self._lock:
+            for checksum in self._entries:
+                _remove(self._path(checksum))
+            self._entries.clear()
+
+    def _touch(self, checksum):
+        """mark the file as recently used"""
+        self._entries.move_to_end(checksum)
+        try:
+            os.utime(self._path(checksum), None)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep):
+        """remove the least recently used files (except the given one) to fit in the limit"""
+        total = self.size
+        for checksum in list(self._entries):
+            if total <= self.max_size:
+                break
+            if checksum == keep:
+                continue
+            total -= self._entries.pop(checksum)
+            _remove(self._path(checksum))
+
+_CACHE = []
+
+def artifact_cache():
+    """return the process-wide cache"""
+    if not _CACHE:
+        _CACHE.append(ArtifactCache())
+    return _CACHE[0]
@@ -1,11 +1,19 @@
 """Connection Manager for RHUI Test Cases"""
 
+import atexit
+import os
 import re
 import logging
+from multiprocessing.pool import ThreadPool
+import threading
+import time
 
 from stitches.connection import Connection
 from stitches.expect import Expect
 
+from rhui3_tests_lib.lines import run_command
+from rhui3_tests_lib.transcript import TRANSCRIPT_ENV, RecordingConnection, transcript_path
+
 SHORT_HOSTNAMES = {"RHUA": "rhua",
                    "CDS_LB": "cds",
                    "CDS": "cds",
@@ -19,25 +27,143 @@ USER_KEY = "/root/.ssh/id_rsa_test"
 SUDO_USER_NAME = "ec2-user"
 SUDO_USER_KEY = "/root/.ssh/id_rsa_rhua"
 
-def _list_hostnames(nodes, fake=False):
+# the environment variable which enables the simulator (see simulator.py); the simulator is only
+# imported when it's used
+SIMULATOR_ENV = "RHUI_SIMULATOR"
+
+# pooled connections released and not asked for again for this long (in seconds) are closed
+POOL_IDLE_TIMEOUT = 900
+
+# the maximum number of hosts to work on at a time in fan_out()
+FAN_OUT_WORKERS = 16
+
+# (hostname, username, sshkey) -> [connection, number of users, time of the last release]
+_POOL = {}
+_POOL_LOCK = threading.Lock()
+
+# the source of hostnames: /etc/hosts, or an Ansible inventory file (hosts_*.cfg) from
+# create-cf-stack.py if the environment variable below points to one
+HOSTS_FILE = "/etc/hosts"
+INVENTORY_ENV = "RHUI_INVENTORY"
+# roles -> Ansible inventory sections
+INVENTORY_SECTIONS = {"RHUA": "RHUA",
+                      "CDS": "CDS",
+                      "HAProxy": "HAPROXY",
+                      "client": "CLI",
+                      "Atomic_client": "ATOMIC_CLI"}
+# roles with numbered hostnames in /etc/hosts (cds01, cds02, ...)
+NUMBERED_ROLES = ["CDS", "HAProxy", "client"]
+
+def _parse_hosts_file(text):
+    """return a role -> hostnames dictionary from /etc/hosts"""
+    hosts = {}
+    for role in INVENTORY_SECTIONS:
+        if role in NUMBERED_ROLES:
+            host_pattern = r"%s[0-9]+\.%s" % (SHORT_HOSTNAMES[role], re.escape(DOMAIN))
+        else:
+            host_pattern = r"\b%s\.%s" % (SHORT_HOSTNAMES[role], re.escape(DOMAIN))
+        hosts[role] = re.findall(host_pattern, text)
+    return hosts
+
+def _parse_ansible_inventory(text):
+    """return a role -> hostnames dictionary from an Ansible inventory file"""
+    sections = {}
+    section = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("["):
+            section = sections.setdefault(line.strip("[]"), [])
+        elif section is not None:
+            section.append(line.split()[0])
+    return {role: sections.get(name, []) for role, name in INVENTORY_SECTIONS.items()}
+
+class _Inventory():
+    """hostnames by role, parsed once and again only when the source file changes"""
+    def __init__(self):
+        self.source = None
+        self.hosts = {}
+
+    def hostnames(self, role):
+        """return a list of hostnames of the given role"""
+        path = os.environ.get(INVENTORY_ENV) or HOSTS_FILE
+        source = (path, os.stat(path).st_mtime)
+        if source != self.source:
+            with open(path) as inventory_file:
+                text = inventory_file.read()
+            if path == HOSTS_FILE:
+                hosts = _parse_hosts_file(text)
+            else:
+                hosts = _parse_ansible_inventory(text)
+            self.hosts, self.source = hosts, source
+        return list(self.hosts.get(role, []))
+
+_INVENTORY = _Inventory()
+
+def _list_hostnames(role, fake=False):
     """return a list of hostnames of the given node type"""
     # if "fake" is on and no hostnames are found, a hostname is made up and returned as
     # a single list item
-    host_pattern = r"%s[0-9]+\.%s" % (nodes, re.escape(DOMAIN))
-    with open("/etc/hosts") as hostsfile:
-        all_hosts = hostsfile.read()
-    matched_hosts = re.findall(host_pattern, all_hosts)
+    matched_hosts = _INVENTORY.hostnames(role)
     if matched_hosts or not fake:
         return matched_hosts
     logging.warning("No hosts found. Using a fake hostname. Proceed with caution.")
-    return ["%s01.%s" % (nodes, DOMAIN)]
+    return ["%s01.%s" % (SHORT_HOSTNAMES[role], DOMAIN)]
+
+def _open(hostname, username, sshkey):
+    """create a connection object (real, simulated, recording)"""
+    # with the simulator enabled, the host is simulated locally (see simulator.py)
+    if os.environ.get(SIMULATOR_ENV):
+        from rhui3_tests_lib.simulator import SimulatedConnection
+        connection = SimulatedConnection(hostname, username)
+    else:
+        connection = Connection(hostname, username, sshkey)
+    # with a transcript directory set, the traffic is recorded (see transcript.py)
+    if os.environ.get(TRANSCRIPT_ENV):
+        return RecordingConnection(connection,
+                                   transcript_path(os.environ[TRANSCRIPT_ENV], hostname))
+    return connection
+
+def _is_healthy(connection):
+    """check the SSH transport of a connection, if it has been opened"""
+    client = getattr(connection, "_lazy_cli", None)
+    if client is None:
+        return True
+    transport = client.get_transport()
+    return transport is not None and transport.is_active()
+
+def _evict_idle(now):
+    """close the pooled connections which nobody uses and which haven't been used in a while"""
+    # to be called with _POOL_LOCK held
+    for key, (connection, users, released) in list(_POOL.items()):
+        if not users and now - released > POOL_IDLE_TIMEOUT:
+            connection.disconnect()
+            del _POOL[key]
+
+class HostResult():
+    """the outcome of a function run on one host by ConMgr.fan_out()"""
+    def __init__(self, hostname, result=None, error=None, duration=0.0):
+        self.hostname = hostname
+        # the return value of the function (the exit code in ConMgr.run_on_all())
+        self.result = result
+        # the exception raised by the function, if any
+        self.error = error
+        self.duration = duration
+        # the output of the command run by ConMgr.run_on_all()
+        self.stdout = ""
+        self.stderr = ""
+
+    def __repr__(self):
+        return "HostResult(%s, result=%r, error=%r, duration=%.2f)" % \
+               (self.hostname, self.result, self.error, self.duration)
 
 class ConMgr():
     """simplify connections to RHUI nodes & clients by providing handy constants and methods"""
     @staticmethod
     def get_rhua_hostname():
         """return the hostname of the RHUA node"""
-        return "%s.%s" % (SHORT_HOSTNAMES["RHUA"], DOMAIN)
+        return (_list_hostnames("RHUA") or ["%s.%s" % (SHORT_HOSTNAMES["RHUA"], DOMAIN)])[0]
 
     @staticmethod
     def get_cds_lb_hostname():
@@ -47,27 +173,115 @@ class ConMgr():
     @staticmethod
     def get_cds_hostnames(fake=True):
         """return a list of CDS hostnames"""
-        return _list_hostnames(SHORT_HOSTNAMES["CDS"], fake)
+        return _list_hostnames("CDS", fake)
 
     @staticmethod
     def get_haproxy_hostnames(fake=True):
         """return a list of HAProxy hostnames; there's usually only a single HAProxy node in RHUI"""
-        return _list_hostnames(SHORT_HOSTNAMES["HAProxy"], fake)
+        return _list_hostnames("HAProxy", fake)
 
     @staticmethod
     def get_cli_hostnames(fake=True):
         """return a list of client hostnames"""
-        return _list_hostnames(SHORT_HOSTNAMES["client"], fake)
+        return _list_hostnames("client", fake)
 
     @staticmethod
     def get_atomic_cli_hostname():
         """return the hostname of the Atomic client"""
-        return "%s.%s" % (SHORT_HOSTNAMES["Atomic_client"], DOMAIN)
+        return (_list_hostnames("Atomic_client") or
+                ["%s.%s" % (SHORT_HOSTNAMES["Atomic_client"], DOMAIN)])[0]
+
+    @staticmethod
+    def get_hostnames(role):
+        """return a list of hostnames of the given role (a key in INVENTORY_SECTIONS)"""
+        return _list_hostnames(role)
 
     @staticmethod
-    def connect(hostname="", username=USER_NAME, sshkey=USER_KEY):
-        """create a connection to the specified host"""
-        return Connection(hostname or ConMgr.get_rhua_hostname(), username, sshkey)
+    def connect(hostname="", username=USER_NAME, sshkey=USER_KEY, pooled=False):
+        """
+        return a new connection to the specified host; with pooled=True, return the connection
+        shared by everyone who asks for the same host, user and key, and call release() when
+        done with it (don't use the interactive shell of a pooled connection)
+        """
+        hostname = hostname or ConMgr.get_rhua_hostname()
+        if not pooled:
+            return _open(hostname, username, sshkey)
+        key = (hostname, username, sshkey)
+        with _POOL_LOCK:
+            _evict_idle(time.time())
+            if key in _POOL:
+                entry = _POOL[key]
+                if not entry[1] and not _is_healthy(entry[0]):
+                    # drop the dead transport; it'll be reopened when the connection is used
+                    entry[0].disconnect()
+            else:
+                entry = _POOL[key] = [_open(hostname, username, sshkey), 0, 0]
+            entry[1] += 1
+            return entry[0]
+
+    @staticmethod
+    def release(connection):
+        """give back a connection obtained with connect(pooled=True)"""
+        with _POOL_LOCK:
+            for entry in _POOL.values():
+                if entry[0] is connection and entry[1]:
+                    entry[1] -= 1
+                    entry[2] = time.time()
+                    return
+
+    @staticmethod
+    def close_all():
+        """close all pooled connections"""
+        with _POOL_LOCK:
+            for connection, _, _ in _POOL.values():
+                connection.disconnect()
+            _POOL.clear()
+
+    @staticmethod
+    def fan_out(hostnames, func, username=USER_NAME, sshkey=USER_KEY, workers=FAN_OUT_WORKERS):
+        """
+        call func(connection) for each of the hosts in parallel, return an ordered list
+        of HostResult objects; exceptions are caught and returned in the results
+        """
+        hostnames = list(dict.fromkeys(hostnames))
+        def _run(hostname):
+            started = time.time()
+            host_result = HostResult(hostname)
+            connection = ConMgr.connect(hostname, username, sshkey, pooled=True)
+            try:
+                host_result.result = func(connection)
+            except Exception as err:
+                host_result.error = err
+            finally:
+                ConMgr.release(connection)
+            host_result.duration = time.time() - started
+            return host_result
+        if not hostnames:
+            return []
+        pool = ThreadPool(min(workers, len(hostnames)))
+        try:
+            return pool.map(_run, hostnames)
+        finally:
+            pool.close()
+
+    @staticmethod
+    def run_on_all(command, hostnames=None, timeout=10, username=USER_NAME, sshkey=USER_KEY):
+        """
+        run the command on the hosts (all CDS & HAProxy nodes by default) in parallel,
+        return HostResult objects with the exit codes (None on timeout) and output
+        """
+        if hostnames is None:
+            hostnames = ConMgr.get_cds_hostnames() + ConMgr.get_haproxy_hostnames()
+        # the output is kept per call: a pooled connection can be used by other callers meanwhile
+        outputs = {}
+        def _run(connection):
+            exit_code, stdout, stderr = run_command(connection, command, timeout)
+            outputs[connection.hostname] = (stdout, stderr)
+            return exit_code
+        results = ConMgr.fan_out(hostnames, _run, username, sshkey)
+        for host_result in results:
+            host_result.stdout, host_result.stderr = outputs.get(host_result.hostname, ("", ""))
+        return results
 
     @staticmethod
     def add_ssh_keys(connection, hostnames, keytype="rsa"):
@@ -83,5 +297,9 @@ class ConMgr():
         if key_file_exists:
             if not hostnames:
                 hostnames = ConMgr.get_cds_hostnames() + ConMgr.get_haproxy_hostnames()
-            for host in hostnames:
-                Expect.expect_retval(connection, "ssh-keygen -R %s" % host)
+            # one round trip for all the hosts
+            if hostnames:
+                Expect.expect_retval(connection,
+                                     " && ".join("ssh-keygen -R %s" % host for host in hostnames))
+
+atexit.register(ConMgr.close_all)
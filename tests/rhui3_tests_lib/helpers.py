@@ -6,6 +6,8 @@ from configparser import ConfigParser
 
 from stitches.expect import Expect
 
+from rhui3_tests_lib.probe import Probe
+
 class Helpers():
     """actions that may be repeated in specific test cases and do not belong in general utils"""
     @staticmethod
@@ -32,12 +34,19 @@ class Helpers():
     @staticmethod
     def check_service(connection, service):
         """check if the given service is running"""
-        return connection.recv_exit_status("systemctl is-active %s" % service) == 0
+        return Probe.services_active(connection, [service])[service]
 
     @staticmethod
     def check_mountpoint(connection, mountpoint):
         """check if something is mounted in the given directory"""
-        return connection.recv_exit_status("mountpoint %s" % mountpoint) == 0
+        return Probe.mountpoints(connection, [mountpoint])[mountpoint]
+
+    @staticmethod
+    def check_service_and_mountpoint(connection, service, mountpoint):
+        """check if the service is running and something is mounted in the directory, at once"""
+        results = Probe.run(connection, ["systemctl is-active %s" % service,
+                                         "mountpoint %s" % mountpoint])
+        return results[0].success, results[1].success
 
     @staticmethod
     def encode_sos_command(command):
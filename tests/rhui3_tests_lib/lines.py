@@ -0,0 +1,106 @@
+"""Streaming Line Iterators for Command Output"""
+
+# The output of a command is read from the channel in chunks and decoded incrementally, and lines
+# are yielded one at a time, so only the current chunk and line are held in memory. The filters
+# are generators too; a caller can stop iterating as soon as it has found what it needed.
+# run_command() reads both outputs of a command while it runs, so the SSH window can't fill up
+# with output nobody reads, and the output is returned to the caller rather than left in shared
+# connection attributes.
+
+from collections import namedtuple
+import codecs
+import re
+import threading
+import time
+
+CHUNK_SIZE = 65536
+NEVRA_PATTERN = re.compile(r"^(.+)-(?:([0-9]+):)?([^-:]+)-([^-]+)\.([^.]+)$")
+
+Nevra = namedtuple("Nevra", ["name", "epoch", "version", "release", "arch"])
+
+def iter_lines(stdout, encoding="utf-8", chunk_size=CHUNK_SIZE):
+    """yield the lines (without line endings) read from the stdout of a command"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    while True:
+        chunk = stdout.read(chunk_size)
+        text = decoder.decode(chunk, final=not chunk)
+        if text:
+            lines = (pending + text).split("\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line.rstrip("\r")
+        if not chunk:
+            break
+    if pending:
+        yield pending.rstrip("\r")
+
+def iter_command(connection, command):
+    """
+    run a command, yield the lines of its output; the channel is closed
+    if the caller stops iterating early
+    """
+    _, stdout, _ = connection.exec_command(command)
+    try:
+        for line in iter_lines(stdout):
+            yield line
+    finally:
+        close = getattr(stdout.channel, "close", None)
+        if close:
+            close()
+
+def run_command(connection, command, timeout=None):
+    """
+    run a command, return its exit status (None if it times out), stdout and stderr (as text)
+    """
+    _, stdout, stderr = connection.exec_command(command)
+    outputs = {}
+    def _drain(name, stream):
+        outputs[name] = b"".join(iter(lambda: stream.read(CHUNK_SIZE), b""))
+    readers = [threading.Thread(target=_drain, args=(name, stream))
+               for name, stream in (("stdout", stdout), ("stderr", stderr))]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+    deadline = time.time() + timeout if timeout else None
+    for reader in readers:
+        reader.join(max(0, deadline - time.time()) if deadline else None)
+        if reader.is_alive():
+            close = getattr(stdout.channel, "close", None)
+            if close:
+                close()
+            return None, "", ""
+    return stdout.channel.recv_exit_status(), \
+           outputs["stdout"].decode(errors="replace"), \
+           outputs["stderr"].decode(errors="replace")
+
+def with_prefix(lines, prefix):
+    """yield the lines starting with the prefix"""
+    for line in lines:
+        if line.startswith(prefix):
+            yield line
+
+def matching(lines, pattern):
+    """yield the lines in which the regular expression is found"""
+    regex = re.compile(pattern) if isinstance(pattern, str) else pattern
+    for line in lines:
+        if regex.search(line):
+            yield line
+
+def non_empty(lines):
+    """yield the lines that aren't empty or blank"""
+    for line in lines:
+        if line.strip():
+            yield line
+
+def nevras(lines):
+    """
+    yield a Nevra record for each line which is a package NEVRA or file name
+    (the epoch is "0" if it isn't specified); other lines are skipped
+    """
+    for line in lines:
+        line = line.strip()
+        match = NEVRA_PATTERN.match(line[:-4] if line.endswith(".rpm") else line)
+        if match:
+            name, epoch, version, release, arch = match.groups()
+            yield Nevra(name, epoch or "0", version, release, arch)
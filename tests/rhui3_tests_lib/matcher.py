@@ -0,0 +1,257 @@
+"""Incremental Output Matching for RHUI Test Cases"""
+
+# A drop-in replacement for the stitches Expect.expect/expect_list/match/ping_pong methods.
+# Instead of re-running every pattern on the whole (growing) output after each received chunk,
+# the literal text a pattern must end with -- typically a prompt such as "rhui (repo) =>" --
+# is looked for in the newly arrived output only, and the complete pattern is evaluated just
+# when that text shows up. Compiled patterns and their literal tails are cached.
+
+import codecs
+from functools import lru_cache
+import logging
+import re
+import socket
+import sys
+import time
+
+from stitches.expect import Expect, ExpectFailed
+
+# how long to wait before polling a non-blocking channel again
+POLL_INTERVAL = 0.1
+# how long to collect output before a pattern without a literal tail is first evaluated
+MIN_WAIT = 1
+RECV_SIZE = 131072
+
+_SPECIAL = set(".^$*+?{}[]|()")
+_ESCAPED_LITERALS = {"n": "\n", "r": "\r", "t": "\t", "f": "\f", "v": "\v", "a": "\a"}
+
+def _tokenize(pattern):
+    """split a pattern into (raw token, literal character or None) pairs"""
+    tokens = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char != "\\" or i + 1 == len(pattern):
+            tokens.append((char, None if char in _SPECIAL else char))
+            i += 1
+            continue
+        nxt = pattern[i + 1]
+        if nxt == "x":
+            size = 4
+            literal = chr(int(pattern[i + 2:i + 4], 16))
+        elif nxt in _ESCAPED_LITERALS:
+            size = 2
+            literal = _ESCAPED_LITERALS[nxt]
+        elif nxt.isdigit():
+            # back reference or octal escape: not worth resolving
+            size = 2
+            while i + size < len(pattern) and size < 4 and pattern[i + size].isdigit():
+                size += 1
+            literal = None
+        elif nxt in "uU":
+            size = 6 if nxt == "u" else 10
+            literal = chr(int(pattern[i + 2:i + size], 16))
+        elif nxt == "N":
+            size = pattern.index("}", i) + 1 - i
+            literal = None
+        elif nxt.isalnum() or nxt == "_":
+            # character classes (\s, \d, ...) and anchors (\A, \b, ...)
+            size = 2
+            literal = None
+        else:
+            size = 2
+            literal = nxt
+        tokens.append((pattern[i:i + size], literal))
+        i += size
+    return tokens
+
+@lru_cache(maxsize=1024)
+def literal_tail(pattern, flags=0):
+    """
+    return the literal text that every match of the pattern ends with,
+    ignoring a trailing ".*"; return an empty string if there's no such text
+    """
+    if flags & (re.IGNORECASE | re.VERBOSE):
+        return ""
+    try:
+        tokens = _tokenize(pattern)
+    except (ValueError, IndexError):
+        return ""
+    raw = [token[0] for token in tokens]
+    if "|" in raw:
+        # alternatives: no single text is required
+        return ""
+    if raw[-2:] == [".", "*"]:
+        tokens = tokens[:-2]
+    tail = []
+    for _, literal in reversed(tokens):
+        if literal is None:
+            break
+        tail.append(literal)
+    return "".join(reversed(tail))
+
+@lru_cache(maxsize=1024)
+def compile_pattern(pattern, flags=re.DOTALL):
+    """compile (and cache) a pattern"""
+    return re.compile(pattern, flags)
+
+def _as_regexp(regexp):
+    """get a compiled pattern from a compiled pattern or a string"""
+    if isinstance(regexp, str):
+        return compile_pattern(regexp, 0)
+    return regexp
+
+class _Watch():
+    """a pattern being waited for, with its literal tail"""
+    def __init__(self, regexp, value):
+        self.regexp = _as_regexp(regexp)
+        self.value = value
+        self.tail = literal_tail(self.regexp.pattern, self.regexp.flags)
+        self.match = None
+
+    def check(self, text, window):
+        """
+        evaluate the pattern if its literal tail is in the window (the new output),
+        return True on a match
+        """
+        if self.tail and self.tail not in window:
+            return False
+        self.match = self.regexp.match(text)
+        return self.match is not None
+
+class _Counter():
+    """occurrences of a literal text, counted in the new output only"""
+    def __init__(self, text, count):
+        self.text = text
+        self.count = count
+        self.tail = text
+        self.seen = 0
+        self.position = 0
+        self.end = 0
+
+    def check(self, text, _):
+        """count the new occurrences, return True once there are enough of them"""
+        position = text.find(self.text, self.position)
+        while position != -1:
+            self.seen += 1
+            self.position = position + len(self.text)
+            if self.seen == self.count:
+                self.end = self.position
+                return True
+            position = text.find(self.text, self.position)
+        self.position = max(self.position, len(text) - len(self.text) + 1)
+        return False
+
+class OutputReader():
+    """output received from a connection's shell channel, read incrementally"""
+    def __init__(self, connection):
+        self.connection = connection
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._parts = []
+        self._text = ""
+
+    @property
+    def text(self):
+        """all the output received so far"""
+        if self._parts:
+            self._text += "".join(self._parts)
+            self._parts = []
+        return self._text
+
+    def recv(self):
+        """receive the next chunk of output, or an empty string if there's none"""
+        try:
+            chunk = self.decoder.decode(self.connection.channel.recv(RECV_SIZE))
+        except socket.timeout:
+            # socket.timeout here means 'no more data'
+            return ""
+        if chunk:
+            logging.getLogger("stitches.expect").debug("RCV: " + chunk)
+            if getattr(self.connection, "output_shell", False):
+                sys.stdout.write(chunk)
+            self._parts.append(chunk)
+        return chunk
+
+    def wait(self, watches, timeout):
+        """
+        receive output until one of the watched patterns matches, return that watch;
+        the timeout is counted like in stitches: in seconds of waiting, at least one per poll
+        """
+        # patterns without a literal tail can match any output, even none or a part of it;
+        # they're evaluated after a minimum wait when the output pauses,
+        # or once a second while it keeps coming
+        tailed = [watch for watch in watches if watch.tail]
+        untailed = [watch for watch in watches if not watch.tail]
+        overlap = max([len(watch.tail) for watch in tailed] or [0]) - 1
+        previous_tail = ""
+        ticks = 0
+        started = last_tick = last_check = time.time()
+        while ticks < timeout:
+            chunk = self.recv()
+            now = time.time()
+            if chunk:
+                window = previous_tail + chunk
+                for watch in tailed:
+                    if watch.check(self.text, window):
+                        return watch
+                previous_tail = window[-overlap:] if overlap > 0 else ""
+            if untailed and now - started >= MIN_WAIT and (not chunk or now - last_check >= 1):
+                last_check = now
+                for watch in untailed:
+                    if watch.check(self.text, ""):
+                        return watch
+            if not chunk:
+                time.sleep(POLL_INTERVAL)
+            if now - last_tick >= 1:
+                ticks += 1
+                last_tick = now
+        raise ExpectFailed(self.text)
+
+class Matcher():
+    """
+    Expect-like methods with incremental matching (see the module comment);
+    the signatures and return values are those of the stitches Expect methods
+    """
+    @staticmethod
+    def expect_list(connection, regexp_list, timeout=10):
+        '''
+        wait for one of the (regexp, return value) pairs to match, return its value
+        '''
+        watches = [_Watch(regexp, value) for regexp, value in regexp_list]
+        return OutputReader(connection).wait(watches, timeout).value
+
+    @staticmethod
+    def expect(connection, strexp, timeout=10):
+        '''
+        wait for the expression (surrounded by .* implicitly) to appear, return True
+        '''
+        return Matcher.expect_list(connection,
+                                   [(compile_pattern(".*" + strexp + ".*"), True)],
+                                   timeout)
+
+    @staticmethod
+    def match(connection, regexp, grouplist=(1,), timeout=10):
+        '''
+        wait for the compiled regexp to match, return a list with the given groups
+        '''
+        logging.getLogger("stitches.expect").debug("MATCHING: " + regexp.pattern)
+        watch = OutputReader(connection).wait([_Watch(regexp, None)], timeout)
+        return [watch.match.group(group) for group in grouplist]
+
+    @staticmethod
+    def ping_pong(connection, command, strexp, timeout=10):
+        '''
+        enter a command and wait for the expression to appear
+        '''
+        Expect.enter(connection, command)
+        return Matcher.expect(connection, strexp, timeout)
+
+    @staticmethod
+    def collect(connection, terminator, count=1, timeout=10):
+        '''
+        return the output up to and including the count-th occurrence of the literal terminator
+        '''
+        reader = OutputReader(connection)
+        counter = _Counter(terminator, count)
+        reader.wait([counter], timeout)
+        return reader.text[:counter.end]
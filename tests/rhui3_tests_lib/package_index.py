@@ -0,0 +1,62 @@
+"""Indexed Package Information"""
+
+from os.path import basename
+
+from rhui3_tests_lib import repodata
+from rhui3_tests_lib.repomd_cache import repomd_cache
+
+class PackageIndex():
+    """packages from a primary.xml file, indexed by NEVRA, file name and name"""
+    def __init__(self, packages=()):
+        self.nevras = set()
+        self.filenames = set()
+        # package name -> NEVRAs
+        self.by_name = {}
+        for package in packages:
+            self.add(package)
+
+    def add(self, package):
+        """add a package record to the index"""
+        self.nevras.add(package.nevra)
+        self.filenames.add(basename(package.location))
+        self.by_name.setdefault(package.name, set()).add(package.nevra)
+
+    @staticmethod
+    def from_file(connection, path):
+        """return the index of a (possibly compressed) primary.xml file on the host"""
+        return PackageIndex(repodata.packages(connection, path))
+
+    @staticmethod
+    def from_repo(connection, repo):
+        """return the index of the packages published in the repo (empty if it isn't published)"""
+        path = repomd_cache().location(connection, repo, "primary")
+        if not path:
+            return PackageIndex()
+        return PackageIndex(repomd_cache().contents(connection, path, repodata.packages))
+
+    @property
+    def count(self):
+        """the number of packages"""
+        return len(self.nevras)
+
+    def filenames_matching(self, prefix=""):
+        """return a sorted list of file names starting with the prefix (case insensitive)"""
+        prefix = prefix.lower()
+        return sorted(name for name in self.filenames if name.lower().startswith(prefix))
+
+    def check(self, items):
+        """return an item (NEVRA, file name or package name) -> bool (is in the index) dictionary"""
+        return {item: item in self for item in items}
+
+    def missing(self, items):
+        """return the set of items (NEVRAs, file names or package names) not in the index"""
+        return {item for item in items if item not in self}
+
+    def __contains__(self, item):
+        return item in self.nevras or item in self.filenames or item in self.by_name
+
+    def __len__(self):
+        return len(self.nevras)
+
+    def __repr__(self):
+        return "PackageIndex(%d packages)" % len(self.nevras)
@@ -0,0 +1,77 @@
+"""Batched Remote Checks for RHUI Test Cases"""
+
+import re
+
+from stitches.expect import ExpectFailed
+
+# the marker which precedes the exit status of each check in the output of the batch
+MARKER = "__rhui_probe__"
+MARKER_PATTERN = re.compile(r"^%s ([0-9]+) ([0-9]+)$" % MARKER, re.MULTILINE)
+
+class ProbeResult():
+    """the outcome of one check"""
+    def __init__(self, command, exit_code):
+        self.command = command
+        self.exit_code = exit_code
+
+    @property
+    def success(self):
+        """did the check succeed (exit with 0)?"""
+        return self.exit_code == 0
+
+    def __repr__(self):
+        return "ProbeResult(%r, %s)" % (self.command, self.exit_code)
+
+class Probe():
+    """run many yes/no checks on a remote host in one round trip"""
+    @staticmethod
+    def run(connection, commands, timeout=10):
+        """
+        run the commands (their output is discarded), return a ProbeResult for each of them
+        """
+        if not commands:
+            return []
+        script = "; ".join("(%s) </dev/null >/dev/null 2>&1; echo %s %d $?" % \
+                           (command, MARKER, index)
+                           for index, command in enumerate(commands))
+        if connection.recv_exit_status(script, timeout) is None:
+            raise ExpectFailed("Got timeout (%i seconds) while running %d checks" % \
+                               (timeout, len(commands)))
+        output = connection.last_stdout
+        if isinstance(output, bytes):
+            output = output.decode()
+        exit_codes = {int(index): int(code) for index, code in MARKER_PATTERN.findall(output)}
+        if len(exit_codes) != len(commands):
+            raise ExpectFailed("Got %d results for %d checks: %s" % \
+                               (len(exit_codes), len(commands), output))
+        return [ProbeResult(command, exit_codes[index])
+                for index, command in enumerate(commands)]
+
+    @staticmethod
+    def check(connection, template, items, timeout=10):
+        """
+        run the command template (with %s) for each of the items,
+        return an item -> bool (check succeeded) dictionary
+        """
+        results = Probe.run(connection, [template % item for item in items], timeout)
+        return dict(zip(items, [result.success for result in results]))
+
+    @staticmethod
+    def files_exist(connection, paths):
+        """return a path -> bool (is a regular file) dictionary"""
+        return Probe.check(connection, "test -f %s", paths)
+
+    @staticmethod
+    def rpms_installed(connection, rpms):
+        """return an RPM -> bool (is installed) dictionary"""
+        return Probe.check(connection, "rpm -q %s", rpms)
+
+    @staticmethod
+    def services_active(connection, services):
+        """return a service -> bool (is running) dictionary"""
+        return Probe.check(connection, "systemctl is-active %s", services)
+
+    @staticmethod
+    def mountpoints(connection, directories):
+        """return a directory -> bool (something is mounted there) dictionary"""
+        return Probe.check(connection, "mountpoint %s", directories)
@@ -0,0 +1,138 @@
+"""Pulp Task Watcher for RHUI Test Cases"""
+
+# Pulp tasks are queried through the Pulp REST API over one keep-alive HTTPS session,
+# authenticated with the certificate that rhui-manager keeps after logging in. This is much
+# lighter than running pulp-admin, so the tasks can be polled a few times per second.
+# The base URL can point to any server implementing the few API calls used here, and it can be
+# overridden in the environment variable below; see simulator.start_pulp_server() for a local
+# stand-in. The certificate includes the private key, so it's kept in a file readable by the user
+# only, and the file is removed when the watcher is closed.
+
+import os
+import tempfile
+import time
+
+import requests
+import urllib3
+
+from rhui3_tests_lib.conmgr import ConMgr
+
+PULP_URL_ENV = "RHUI_PULP_URL"
+API_PATH = "/pulp/api/v2/"
+ACTIVE_STATES = ["accepted", "waiting", "running", "suspended"]
+FINAL_STATES = ["finished", "error", "canceled", "skipped"]
+POLL_INTERVAL = 0.5
+
+class PulpTaskError(Exception):
+    """
+    Raised when a Pulp task fails or the waiting times out
+    """
+
+class PulpTaskWatcher():
+    """query and wait for Pulp tasks"""
+    def __init__(self, base_url, cert=None, verify=False, poll_interval=POLL_INTERVAL):
+        # verify can be a path to a CA certificate; the RHUA uses its own CA
+        self.base_url = base_url.rstrip("/") + "/"
+        self.poll_interval = poll_interval
+        self.session = requests.Session()
+        self.session.cert = cert
+        self.session.verify = verify
+        # a certificate file to remove on close()
+        self.temporary_cert = None
+        if not verify:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        # task state -> number of tasks, as of the last poll
+        self.counters = {}
+
+    @staticmethod
+    def for_rhua(connection):
+        """
+        return a watcher for the Pulp server on the RHUA,
+        using the certificate of the logged in rhui-manager user
+        """
+        if os.environ.get(PULP_URL_ENV):
+            return PulpTaskWatcher(os.environ[PULP_URL_ENV])
+        rhua = ConMgr.get_rhua_hostname()
+        # mkstemp() creates the file with mode 0600
+        handle, local_cert = tempfile.mkstemp(prefix="rhui-manager-", suffix=".crt")
+        os.close(handle)
+        try:
+            connection.sftp.get("/root/.rhui/%s/user.crt" % rhua, local_cert)
+        except Exception:
+            os.remove(local_cert)
+            raise
+        watcher = PulpTaskWatcher("https://%s%s" % (rhua, API_PATH), local_cert)
+        watcher.temporary_cert = local_cert
+        return watcher
+
+    def close(self):
+        """close the session and remove the temporary certificate file, if any"""
+        self.session.close()
+        if self.temporary_cert:
+            try:
+                os.remove(self.temporary_cert)
+            except FileNotFoundError:
+                pass
+            self.temporary_cert = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _request(self, method, path, **kwargs):
+        """send a request to the API, return the decoded JSON response"""
+        response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def task(self, task_id):
+        """return the task with the given ID"""
+        return self._request("GET", "tasks/%s/" % task_id)
+
+    def active_tasks(self):
+        """return a list of waiting and running tasks"""
+        criteria = {"criteria": {"filters": {"state": {"$in": ACTIVE_STATES}},
+                                 "fields": ["task_id", "state", "progress_report"]}}
+        tasks = self._request("POST", "tasks/search/", json=criteria)
+        self.counters = {}
+        for task in tasks:
+            self.counters[task["state"]] = self.counters.get(task["state"], 0) + 1
+        return tasks
+
+    def wait_until_idle(self, timeout=3600):
+        """wait until there are no waiting or running tasks"""
+        deadline = time.time() + timeout
+        while self.active_tasks():
+            if time.time() > deadline:
+                raise PulpTaskError("Pulp tasks still active after %s seconds: %s" % \
+                                    (timeout, self.counters))
+            time.sleep(self.poll_interval)
+
+    def wait_for_tasks(self, task_ids, timeout=3600, fail_on_error=True):
+        """
+        wait until the given tasks have finished, return a task ID -> final state dictionary;
+        the counters show the number of tasks in each state as of the last poll
+        """
+        deadline = time.time() + timeout
+        states = {}
+        pending = list(task_ids)
+        while True:
+            for task_id in pending:
+                states[task_id] = self.task(task_id)["state"]
+            pending = [task_id for task_id in pending if states[task_id] not in FINAL_STATES]
+            self.counters = {}
+            for state in states.values():
+                self.counters[state] = self.counters.get(state, 0) + 1
+            if not pending:
+                break
+            if time.time() > deadline:
+                raise PulpTaskError("Pulp tasks not finished after %s seconds: %s" % \
+                                    (timeout, pending))
+            time.sleep(self.poll_interval)
+        failed = [task_id for task_id, state in states.items() if state != "finished"]
+        if failed and fail_on_error:
+            raise PulpTaskError("Pulp tasks failed: %s" % {task_id: states[task_id]
+                                                           for task_id in failed})
+        return states
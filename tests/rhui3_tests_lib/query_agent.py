@@ -0,0 +1,162 @@
+"""Batched rhui-manager Queries"""
+
+# The agent is a small script which is uploaded to the RHUA once. It reads a JSON list of
+# rhui-manager argument lists on stdin, runs rhui-manager for each of them in the agent's own
+# process via runpy (so rhui-manager and its libraries are only loaded once), and prints a JSON
+# list with the exit status, stdout and stderr of each run. It's run with the interpreter of
+# rhui-manager, and it works with both Python 2 and 3.
+#
+# As all the runs share one interpreter, anything rhui-manager keeps in imported modules (caches,
+# open connections, changed settings) carries over from one run to the next. Only batch read-only
+# queries which don't depend on such state.
+#
+# The answers can be large, so they're written to a file on the RHUA and fetched over SFTP,
+# rather than read from the output of the command, which could fill up the SSH window.
+#
+# The agent is run as root, so it's kept in a directory in the user's home which only the user can
+# access, it's uploaded to a temporary directory there and moved in place when complete, and its
+# checksum is verified before every run.
+
+import base64
+import hashlib
+import json
+import threading
+
+from rhui3_tests_lib.lines import run_command
+
+AGENT_SCRIPT = '''\
+import json
+import runpy
+import sys
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+RHUI_MANAGER = sys.argv[1]
+
+def run(argv):
+    """run rhui-manager with the arguments, return the outcome"""
+    stdout, stderr = StringIO(), StringIO()
+    saved = sys.argv, sys.stdin, sys.stdout, sys.stderr
+    sys.argv = [RHUI_MANAGER] + argv
+    sys.stdin, sys.stdout, sys.stderr = StringIO(), stdout, stderr
+    status = 0
+    try:
+        runpy.run_path(RHUI_MANAGER, run_name="__main__")
+    except SystemExit as exc:
+        if exc.code is None or isinstance(exc.code, int):
+            status = exc.code or 0
+        else:
+            stderr.write("%s\\n" % exc.code)
+            status = 1
+    except Exception as exc:
+        stderr.write("%s: %s\\n" % (type(exc).__name__, exc))
+        status = 1
+    finally:
+        sys.argv, sys.stdin, sys.stdout, sys.stderr = saved
+    return {"status": status, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+QUERIES = json.load(sys.stdin)
+json.dump([run(argv) for argv in QUERIES], sys.stdout)
+'''
+AGENT_DIGEST = hashlib.sha256(AGENT_SCRIPT.encode()).hexdigest()
+# the agent and its answers are kept in a directory accessible to the user only
+AGENT_DIR = "~/.rhui3_query_agent"
+AGENT_NAME = "agent-%s.py" % AGENT_DIGEST[:12]
+# the exit status of the command if the agent isn't the expected one
+AGENT_MISMATCH = 99
+
+class QueryAgentError(Exception):
+    """
+    Raised when the query agent can't be run or its output can't be read
+    """
+
+class QueryAgent():
+    """run many rhui-manager commands in one remote process"""
+    # hostname -> the agent directory on the host, where the agent is known to be installed
+    _installed = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def install(connection):
+        """
+        upload the agent to the host unless it's already there (and intact),
+        return the agent directory on the host
+        """
+        with QueryAgent._lock:
+            if connection.hostname in QueryAgent._installed:
+                return QueryAgent._installed[connection.hostname]
+            # print the directory, and a new upload directory in it unless the agent is intact
+            command = "umask 077 && D=%s && mkdir -p $D && chmod 700 $D && echo $D && " % \
+                      AGENT_DIR + \
+                      "{ echo '%s  '$D/%s | sha256sum -c --status || " % \
+                      (AGENT_DIGEST, AGENT_NAME) + \
+                      "mktemp -d $D/upload.XXXXXX; }"
+            status, output, error = run_command(connection, command, 60)
+            if status != 0:
+                raise QueryAgentError("Cannot prepare the query agent directory on %s: %s" % \
+                                      (connection.hostname, error))
+            directories = output.split()
+            if len(directories) > 1:
+                # upload to a private directory, then move the complete file in place
+                with connection.sftp.open(directories[1] + "/agent.py", "w") as agent_file:
+                    agent_file.write(AGENT_SCRIPT.encode())
+                command = "mv -f %s/agent.py %s/%s && rmdir %s" % \
+                          (directories[1], directories[0], AGENT_NAME, directories[1])
+                status, _, error = run_command(connection, command, 60)
+                if status != 0:
+                    raise QueryAgentError("Cannot install the query agent on %s: %s" % \
+                                          (connection.hostname, error))
+            QueryAgent._installed[connection.hostname] = directories[0]
+            return directories[0]
+
+    @staticmethod
+    def run(connection, queries, timeout=300):
+        """
+        run rhui-manager with each of the argument lists,
+        return a list of {"status": ..., "stdout": ..., "stderr": ...} dictionaries
+        """
+        if not queries:
+            return []
+        payload = base64.b64encode(json.dumps(queries).encode()).decode()
+        for attempt in range(2):
+            directory = QueryAgent.install(connection)
+            # the agent is checked before every run, as it's run as root;
+            # the command prints the name of the answers file
+            command = "A=%s/%s && echo '%s  '$A | sha256sum -c --status || exit %d; " % \
+                      (directory, AGENT_NAME, AGENT_DIGEST, AGENT_MISMATCH) + \
+                      "umask 077 && F=`mktemp %s/answers.XXXXXX` && echo $F && " % directory + \
+                      "RM=`command -v rhui-manager` && " + \
+                      "echo %s | base64 -d | `sed -n '1s/^#!//p' $RM` $A $RM > $F" % payload
+            answers_path = None
+            try:
+                status, answers_path, error = run_command(connection, command, timeout)
+                answers_path = answers_path.strip()
+                if status == AGENT_MISMATCH and not attempt:
+                    # changed or removed since it was installed: install it again
+                    with QueryAgent._lock:
+                        QueryAgent._installed.pop(connection.hostname, None)
+                    continue
+                if status != 0:
+                    raise QueryAgentError("The query agent failed on %s: %s" % \
+                                          (connection.hostname,
+                                           error if status is not None else "timed out"))
+                with connection.sftp.open(answers_path) as answers_file:
+                    output = answers_file.read()
+                break
+            finally:
+                if answers_path:
+                    try:
+                        connection.sftp.remove(answers_path)
+                    except IOError:
+                        pass
+        if isinstance(output, bytes):
+            output = output.decode()
+        try:
+            answers = json.loads(output)
+        except ValueError:
+            raise QueryAgentError("Unexpected output from the query agent: %s" % output) from None
+        if len(answers) != len(queries):
+            raise QueryAgentError("Got %d answers to %d queries" % (len(answers), len(queries)))
+        return answers
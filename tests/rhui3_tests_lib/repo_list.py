@@ -0,0 +1,104 @@
+"""Repository Lists Shown by rhui-manager"""
+
+# The repo list on the Repository Management screen is parsed into Repo strings, which carry
+# the name, version, kind and section of each repo. The latest list is kept per host until
+# it's forgotten (see forget()), which happens whenever the library changes the repos.
+
+import re
+import threading
+
+# section headers in the repo list -> sections, and the kinds of Red Hat repositories
+REPO_SECTIONS = {"Custom Repositories": "Custom", "Red Hat Repositories": "Red Hat"}
+REPO_KINDS = ["OSTree", "Docker", "Yum"]
+# the version of a Red Hat repository is in the last parentheses
+REPO_VERSION_PATTERN = re.compile(r"^(.*) \(([^()]*)\)$")
+
+class NoSuchRepoError(Exception):
+    '''
+    To be raised if a repo isn't listed.
+    '''
+
+class Repo(str):
+    '''
+    A repository as listed by rhui-manager. The string is the whole line; the name, the version
+    (of a Red Hat repository), the kind (Custom, Docker, OSTree, or Yum) and the section
+    (Custom or Red Hat) are available as attributes.
+    '''
+    def __new__(cls, line, section="Custom", kind="Custom"):
+        repo = str.__new__(cls, line)
+        repo.section = section
+        repo.kind = kind
+        match = REPO_VERSION_PATTERN.match(line) if section == "Red Hat" else None
+        repo.name, repo.version = match.groups() if match else (line, "")
+        return repo
+
+class RepoList(list):
+    '''
+    The repositories listed by rhui-manager (a list of Repo strings), indexed by the whole line
+    and by the name. Not to be modified.
+    '''
+    def __init__(self, repos=()):
+        list.__init__(self, repos)
+        self.by_line = {}
+        self.by_name = {}
+        for repo in self:
+            self.by_line.setdefault(str(repo), repo)
+            self.by_name.setdefault(repo.name, repo)
+
+    def get(self, name):
+        '''
+        return the repo with the given whole line or name, or None
+        '''
+        return self.by_line.get(name) or self.by_name.get(name)
+
+    def find(self, text):
+        '''
+        return the repo with the given whole line or name, or the first one containing the text;
+        raise NoSuchRepoError if there's no such repo
+        '''
+        repo = self.get(text) or next((repo for repo in self if text in repo), None)
+        if repo is None:
+            raise NoSuchRepoError("No listed repo matches '%s'. Listed repos: %s" % \
+                                  (text, list(self)))
+        return repo
+
+    def __contains__(self, line):
+        return line in self.by_line
+
+    @staticmethod
+    def parse(lines):
+        '''
+        return a RepoList of the repositories in the lines of the listing
+        '''
+        repolist = []
+        section = kind = ""
+        for line in (line.strip() for line in lines):
+            if line in REPO_SECTIONS:
+                section = kind = REPO_SECTIONS[line]
+                continue
+            if line in REPO_KINDS:
+                kind = line
+                continue
+            if line in ["", "No repositories are currently managed by the RHUI"]:
+                continue
+            repolist.append(Repo(line, section, kind))
+        return RepoList(repolist)
+
+# hostname -> RepoList for the latest repo list
+_LISTINGS = {}
+_LISTINGS_LOCK = threading.Lock()
+
+def remember(connection, repos):
+    """keep the RepoList as the latest one for the host"""
+    with _LISTINGS_LOCK:
+        _LISTINGS[connection.hostname] = repos
+
+def latest(connection):
+    """return the latest RepoList of the host, or None if it isn't known"""
+    with _LISTINGS_LOCK:
+        return _LISTINGS.get(connection.hostname)
+
+def forget(connection):
+    """forget the latest RepoList of the host (the repos have changed)"""
+    with _LISTINGS_LOCK:
+        _LISTINGS.pop(connection.hostname, None)
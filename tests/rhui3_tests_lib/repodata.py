@@ -0,0 +1,181 @@
+"""Streaming Reader of Yum Repodata"""
+
+# Repodata files are read from the remote host over SFTP in chunks, decompressed on the fly
+# (gzip, xz and bzip2 are detected by their magic bytes) and parsed incrementally. Each record
+# element is turned into a typed record and then dropped from the parse tree, so the memory use
+# doesn't depend on the size of the file.
+
+import bz2
+from collections import namedtuple
+import lzma
+from xml.etree.ElementTree import XMLPullParser
+import zlib
+
+CHUNK_SIZE = 262144
+PUBLISHED_PATH = "/var/lib/rhui/remote_share/published/yum/https/repos"
+
+RepomdRecord = namedtuple("RepomdRecord", ["type", "location", "checksum", "open_checksum",
+                                           "timestamp", "size"])
+Group = namedtuple("Group", ["id", "name", "uservisible", "packages"])
+Langpack = namedtuple("Langpack", ["name", "install"])
+Advisory = namedtuple("Advisory", ["id", "type", "severity", "title", "issued", "packages"])
+
+def nevra(name, epoch, version, release, arch):
+    """return the name-epoch:version-release.arch string (without the epoch if it's 0)"""
+    if epoch and epoch != "0":
+        return "%s-%s:%s-%s.%s" % (name, epoch, version, release, arch)
+    return "%s-%s-%s.%s" % (name, version, release, arch)
+
+class Package(namedtuple("Package", ["name", "epoch", "version", "release", "arch", "location",
+                                       "checksum"])):
+    """a package in primary.xml"""
+    __slots__ = ()
+
+    @property
+    def nevra(self):
+        """the NEVRA of the package"""
+        return nevra(self.name, self.epoch, self.version, self.release, self.arch)
+
+class _Identity():
+    """a decompressor for uncompressed data"""
+    @staticmethod
+    def decompress(data):
+        """return the data as is"""
+        return data
+
+def _decompressor(head):
+    """return a decompressor object suitable for data starting with the given bytes"""
+    if head.startswith(b"\x1f\x8b"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if head.startswith(b"\xfd7zXZ\x00"):
+        return lzma.LZMADecompressor()
+    if head.startswith(b"BZh"):
+        return bz2.BZ2Decompressor()
+    return _Identity()
+
+def read_chunks(connection, path, chunk_size=CHUNK_SIZE):
+    """yield the (decompressed) contents of a remote file in chunks"""
+    remote_file = connection.sftp.open(path, "rb")
+    try:
+        remote_file.prefetch()
+        decompressor = None
+        while True:
+            chunk = remote_file.read(chunk_size)
+            if not chunk:
+                break
+            if not decompressor:
+                decompressor = _decompressor(chunk)
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+    finally:
+        remote_file.close()
+
+def _local_name(tag):
+    """the tag without the namespace"""
+    return tag.rsplit("}", 1)[-1]
+
+def iterparse(connection, path, tags):
+    """
+    yield the elements with the given (local) tag names from a remote XML file as they are
+    completed; an element is removed from the tree as soon as the consumer asks for the next one
+    """
+    parser = XMLPullParser(events=("start", "end"))
+    # the open elements
+    stack = []
+    for data in read_chunks(connection, path):
+        parser.feed(data)
+        for event, element in parser.read_events():
+            if event == "start":
+                stack.append(element)
+                continue
+            stack.pop()
+            if _local_name(element.tag) in tags:
+                yield element
+                if stack:
+                    stack[-1].remove(element)
+    parser.close()
+
+def _child(element, name):
+    """return the first child element with the given (local) name, or None"""
+    for child in element:
+        if _local_name(child.tag) == name:
+            return child
+    return None
+
+def _child_text(element, name, default=None):
+    """return the text of the first child element with the given (local) name"""
+    child = _child(element, name)
+    if child is None:
+        return default
+    return child.text or ""
+
+def _child_attribute(element, name, attribute, default=None):
+    """return an attribute of the first child element with the given (local) name"""
+    child = _child(element, name)
+    if child is None:
+        return default
+    return child.get(attribute, default)
+
+def repomd_revision(connection, path):
+    """return the revision of a remote repomd.xml file"""
+    for element in iterparse(connection, path, ["revision"]):
+        return element.text
+    return None
+
+def repomd_records(connection, path):
+    """yield the data records of a remote repomd.xml file"""
+    for element in iterparse(connection, path, ["data"]):
+        size = _child_text(element, "size")
+        yield RepomdRecord(element.get("type"),
+                           _child_attribute(element, "location", "href"),
+                           _child_text(element, "checksum"),
+                           _child_text(element, "open-checksum"),
+                           _child_text(element, "timestamp"),
+                           int(size) if size else None)
+
+def packages(connection, path):
+    """yield the package records of a remote primary.xml file"""
+    for element in iterparse(connection, path, ["package"]):
+        version = _child(element, "version")
+        yield Package(_child_text(element, "name"),
+                      version.get("epoch", "0"),
+                      version.get("ver"),
+                      version.get("rel"),
+                      _child_text(element, "arch"),
+                      _child_attribute(element, "location", "href"),
+                      _child_text(element, "checksum"))
+
+def groups(connection, path):
+    """yield the group records of a remote comps.xml file"""
+    for element in iterparse(connection, path, ["group"]):
+        packagelist = _child(element, "packagelist")
+        yield Group(_child_text(element, "id"),
+                    _child_text(element, "name"),
+                    _child_text(element, "uservisible", "true").strip().lower() == "true",
+                    [package.text for package in packagelist] if packagelist is not None else [])
+
+def langpacks(connection, path):
+    """yield the langpack records of a remote comps.xml file"""
+    for element in iterparse(connection, path, ["match"]):
+        yield Langpack(element.get("name"), element.get("install"))
+
+def advisories(connection, path):
+    """yield the advisory records of a remote updateinfo.xml file"""
+    for element in iterparse(connection, path, ["update"]):
+        pkglist = _child(element, "pkglist")
+        nevras = []
+        if pkglist is not None:
+            for package in pkglist.iter():
+                if _local_name(package.tag) == "package":
+                    nevras.append(nevra(package.get("name"),
+                                        package.get("epoch", "0"),
+                                        package.get("version"),
+                                        package.get("release"),
+                                        package.get("arch")))
+        yield Advisory(_child_text(element, "id"),
+                       element.get("type"),
+                       _child_text(element, "severity", ""),
+                       _child_text(element, "title", ""),
+                       _child_attribute(element, "issued", "date"),
+                       nevras)
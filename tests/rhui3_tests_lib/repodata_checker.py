@@ -0,0 +1,107 @@
+"""Consistency Checks of Published Repodata Across RHUI Nodes"""
+
+# Each node computes the SHA-256 checksums of the repodata files it serves, and only the revisions
+# and the checksums are transferred. The nodes are examined in parallel, and each CDS is compared
+# with the RHUA. The output is read while the command runs, as there can be a lot of it.
+
+from rhui3_tests_lib.conmgr import ConMgr
+from rhui3_tests_lib.lines import run_command
+from rhui3_tests_lib.repodata import PUBLISHED_PATH
+
+class RepodataChecker():
+    """compare the published repodata on the RHUA and the CDS nodes"""
+    @staticmethod
+    def snapshot(connection, relative_paths=None, timeout=600):
+        """
+        return a relative path -> {"revision": ..., "files": {file name: checksum}} dictionary
+        for the given repos (all published repos by default); missing repos aren't included
+        """
+        if relative_paths is None:
+            paths = "find -L . -path '*/repodata/repomd.xml' | " \
+                    "sed -e 's:^\\./::' -e 's:/repodata/repomd.xml$::'"
+        else:
+            if not relative_paths:
+                return {}
+            paths = "printf '%%s\\n' %s" % " ".join(relative_paths)
+        # a failure in any of the repos (an unreadable file, for example) fails the command,
+        # not just one in the last repo
+        command = "set -o pipefail && cd %s && %s | { e=0; while read r; do " % \
+                  (PUBLISHED_PATH, paths) + \
+                  "[ -f $r/repodata/repomd.xml ] || continue; " + \
+                  "echo REV $r `sed -n 's:.*<revision>\\(.*\\)</revision>.*:\\1:p' " + \
+                  "$r/repodata/repomd.xml`; " + \
+                  "sha256sum $r/repodata/* | sed 's:^:SUM :' || e=1; done; exit $e; }"
+        status, output, error = run_command(connection, command, timeout)
+        if status != 0:
+            raise RuntimeError("Cannot examine the repodata on %s: %s" % \
+                               (connection.hostname,
+                                error if status is not None else "timed out"))
+        repos = {}
+        for line in output.splitlines():
+            fields = line.split()
+            if fields[0] == "REV":
+                repos[fields[1]] = {"revision": fields[2] if len(fields) > 2 else "",
+                                    "files": {}}
+            elif fields[0] == "SUM":
+                relative_path, filename = fields[2].rsplit("/repodata/", 1)
+                repos[relative_path]["files"][filename] = fields[1]
+        return repos
+
+    @staticmethod
+    def compare(expected, actual):
+        """return a list of differences between two snapshots of one repo (None = missing)"""
+        if actual is None:
+            return ["not published"]
+        if expected is None:
+            return ["not published on the RHUA"]
+        problems = []
+        if actual["revision"] != expected["revision"]:
+            problems.append("revision %s instead of %s" % (actual["revision"],
+                                                           expected["revision"]))
+        for filename in sorted(set(expected["files"]) | set(actual["files"])):
+            if filename not in actual["files"]:
+                problems.append("%s is missing" % filename)
+            elif filename not in expected["files"]:
+                problems.append("%s is extra" % filename)
+            elif actual["files"][filename] != expected["files"][filename]:
+                problems.append("%s has a different checksum" % filename)
+        return problems
+
+    @staticmethod
+    def check(relative_paths=None, cds_hostnames=None):
+        """
+        compare the repodata on the CDS nodes (all by default) with the RHUA in parallel,
+        return a relative path -> {CDS hostname: [problems]} dictionary with the mismatches;
+        problems with a whole node are reported under the None key
+        """
+        rhua = ConMgr.get_rhua_hostname()
+        if cds_hostnames is None:
+            cds_hostnames = ConMgr.get_cds_hostnames()
+        results = ConMgr.fan_out([rhua] + list(cds_hostnames),
+                                 lambda connection: RepodataChecker.snapshot(connection,
+                                                                             relative_paths))
+        if results[0].error:
+            raise results[0].error
+        expected = results[0].result
+        report = {}
+        for host_result in results[1:]:
+            if host_result.error:
+                report.setdefault(None, {})[host_result.hostname] = [str(host_result.error)]
+                continue
+            for relative_path in sorted(set(expected) | set(host_result.result)):
+                problems = RepodataChecker.compare(expected.get(relative_path),
+                                                   host_result.result.get(relative_path))
+                if problems:
+                    report.setdefault(relative_path, {})[host_result.hostname] = problems
+        return report
+
+    @staticmethod
+    def format_report(report):
+        """return the report as text"""
+        lines = []
+        for relative_path in sorted(report, key=str):
+            lines.append(relative_path or "(whole nodes)")
+            for hostname in sorted(report[relative_path]):
+                lines.extend("  %s: %s" % (hostname, problem)
+                             for problem in report[relative_path][hostname])
+        return "\n".join(lines)
@@ -0,0 +1,114 @@
+"""Cache of Published Repodata Information"""
+
+# For each repo, the cache keeps the data type -> location map from repomd.xml and the parsed
+# contents of the metadata files (comps, updateinfo etc.), all keyed by the SHA-256 checksum
+# of the published repomd.xml file. Each lookup only checks the checksum,
+# which is a cheap command as repomd.xml is small; if the file has changed, is gone or has moved,
+# the information about the repo is discarded and read again.
+
+import threading
+
+from rhui3_tests_lib import repodata
+from rhui3_tests_lib.lines import run_command
+from rhui3_tests_lib.rhuimanager_cmdline import RepoInfoIndex
+
+class RepomdCache():
+    """repodata information memoized per repo and repomd.xml checksum"""
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (hostname, repo ID) -> {"checksum": ..., "locations": {...}, "contents": {...}}
+        self._entries = {}
+        # (hostname, metadata file path) -> repo ID
+        self._owners = {}
+
+    def relative_path(self, connection, repo):
+        """return the relative path of the repo"""
+        return RepoInfoIndex.get(connection, repo)["relativepath"]
+
+    def _repomd_path(self, connection, repo):
+        """return the path to the published repomd.xml file of the repo"""
+        return "%s/%s/repodata/repomd.xml" % (repodata.PUBLISHED_PATH,
+                                              self.relative_path(connection, repo))
+
+    @staticmethod
+    def _checksum(connection, path):
+        """return the checksum of a remote file, or None if it can't be read"""
+        status, output, _ = run_command(connection, "sha256sum %s" % path, 30)
+        if status != 0:
+            return None
+        return output.split()[0]
+
+    def _entry(self, connection, repo):
+        """return the up-to-date information about the repo, or None if it isn't published"""
+        key = (connection.hostname, repo)
+        checksum = self._checksum(connection, self._repomd_path(connection, repo))
+        if not checksum:
+            # the repo may have been re-created with another relative path
+            self.forget(connection, repo)
+            checksum = self._checksum(connection, self._repomd_path(connection, repo))
+            if not checksum:
+                return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry["checksum"] == checksum:
+                self.hits += 1
+                return entry
+            self.misses += 1
+        base_path = "%s/%s" % (repodata.PUBLISHED_PATH, self.relative_path(connection, repo))
+        locations = {record.type: "%s/%s" % (base_path, record.location) for record in
+                     repodata.repomd_records(connection, self._repomd_path(connection, repo))}
+        entry = {"checksum": checksum, "locations": locations, "contents": {}}
+        with self._lock:
+            self._entries[key] = entry
+            for path in locations.values():
+                self._owners[(connection.hostname, path)] = repo
+        return entry
+
+    def locations(self, connection, repo):
+        """return a data type -> path (on the RHUA) dictionary for the repo"""
+        entry = self._entry(connection, repo)
+        return dict(entry["locations"]) if entry else {}
+
+    def location(self, connection, repo, datatype):
+        """return the path to the repo file of the given data type, or None"""
+        return self.locations(connection, repo).get(datatype)
+
+    def contents(self, connection, path, parser):
+        """
+        return the list of records produced by the parser (e.g. repodata.groups) from the file;
+        the list is memoized if the file belongs to a repo known to the cache
+        """
+        repo = self._owners.get((connection.hostname, path))
+        entry = self._entry(connection, repo) if repo else None
+        if not entry or path not in entry["locations"].values():
+            return list(parser(connection, path))
+        with self._lock:
+            records = entry["contents"].get((path, parser.__name__))
+        if records is None:
+            records = list(parser(connection, path))
+            with self._lock:
+                entry["contents"][(path, parser.__name__)] = records
+        return records
+
+    def forget(self, connection, repo):
+        """discard the information about the repo"""
+        key = (connection.hostname, repo)
+        RepoInfoIndex.invalidate(connection, repo)
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """discard everything"""
+        with self._lock:
+            self._entries.clear()
+            self._owners.clear()
+
+_CACHE = []
+
+def repomd_cache():
+    """return the process-wide cache"""
+    if not _CACHE:
+        _CACHE.append(RepomdCache())
+    return _CACHE[0]
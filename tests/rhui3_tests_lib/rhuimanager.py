@@ -3,21 +3,125 @@
 import logging
 import re
 
-from stitches.expect import Expect, ExpectFailed
+from stitches.expect import CTRL_C, Expect, ExpectFailed
 
 from rhui3_tests_lib.conmgr import ConMgr
+from rhui3_tests_lib.matcher import Matcher
+from rhui3_tests_lib.selectionscreen import SelectionScreen
 from rhui3_tests_lib.util import Util
 
 SELECT_PATTERN = re.compile(r'^  (x|-)  (\d+) :')
+MORE_COMMANDS = "for more commands:"
 PROCEED_PATTERN = re.compile(r'.*Proceed\? \(y/n\).*', re.DOTALL)
 CONFIRM_PATTERN_STRING = r"Enter value \([\d]+-[\d]+\) to toggle selection, " + \
                          r"'c' to confirm selections, or '\?' for more commands: "
+HOME_PROMPT = r"rhui \(home\) =>"
+SCREEN_KEYS = {"repo": "r",
+               "cds": "c",
+               "loadbalancers": "l",
+               "sync": "s",
+               "identity": "i",
+               "users": "u",
+               "client": "e",
+               "entitlements": "n",
+               "subscriptions": "sm"}
 
 class NotSelectLine(ValueError):
     """
     to be raised when the line isn't actually a selection line
     """
 
+def _screen_key(screen_name):
+    '''
+    return the key that opens the given rhui-manager screen from the home screen
+    '''
+    if screen_name not in SCREEN_KEYS:
+        raise ValueError("Unsupported screen name: " + screen_name)
+    return SCREEN_KEYS[screen_name]
+
+class RHUIManagerSession():
+    '''
+    A long-lived rhui-manager process which moves between screens without relaunching.
+
+    While the session is running, RHUIManager.screen() and RHUIManager.quit() navigate
+    in it instead of starting and quitting rhui-manager, so the RHUIManagerRepo, RHUIManagerSync
+    and RHUIManagerInstance helpers can be used as usual:
+
+        with RHUIManagerSession(connection):
+            RHUIManagerRepo.add_custom_repo(connection, "repo1")
+            RHUIManagerSync.sync_repo(connection, ["repo1"])
+    '''
+    def __init__(self, connection):
+        self.connection = connection
+        # the screen whose prompt was seen last; None if rhui-manager isn't running
+        self.current_screen = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            # a helper failed and rhui-manager can be in the middle of anything; abort it first
+            Expect.enter(self.connection, CTRL_C)
+        self.stop()
+
+    @staticmethod
+    def active(connection):
+        '''
+        return the session running on the connection, or None
+        '''
+        return getattr(connection, "rhuimanager_session", None)
+
+    def start(self):
+        '''
+        run rhui-manager and wait for the home screen
+        '''
+        if RHUIManagerSession.active(self.connection):
+            raise RuntimeError("A rhui-manager session is already running on this connection.")
+        Expect.enter(self.connection, "rhui-manager")
+        Matcher.expect(self.connection, HOME_PROMPT)
+        self.current_screen = "home"
+        self.connection.rhuimanager_session = self
+        return self
+
+    def stop(self):
+        '''
+        quit rhui-manager
+        '''
+        self.connection.rhuimanager_session = None
+        if self.current_screen:
+            Expect.enter(self.connection, "q")
+        self.current_screen = None
+
+    def goto(self, screen_name):
+        '''
+        switch to the given screen and eat its prompt (go through the home screen if needed)
+        '''
+        key = _screen_key(screen_name)
+        if screen_name == self.current_screen:
+            return
+        if self.current_screen != "home":
+            Expect.enter(self.connection, "home")
+            Matcher.expect(self.connection, HOME_PROMPT)
+            self.current_screen = "home"
+        Expect.enter(self.connection, key)
+        Matcher.expect(self.connection, r"rhui \(" + screen_name + r"\) =>")
+        self.current_screen = screen_name
+
+    def interrupt(self):
+        '''
+        interrupt a running action (such as a live status display) and eat the prompt;
+        start rhui-manager again if the interrupt made it exit
+        '''
+        Expect.enter(self.connection, CTRL_C)
+        state = Matcher.expect_list(self.connection,
+                                    [(re.compile(r".*rhui \(.*\) =>.*", re.DOTALL), 1),
+                                     (re.compile(r".*[#$] $", re.DOTALL), 2)])
+        if state == 2:
+            Expect.enter(self.connection, "rhui-manager")
+            Matcher.expect(self.connection, HOME_PROMPT)
+            self.current_screen = "home"
+
 class RHUIManager():
     '''
     Basic functions to manage rhui-manager.
@@ -41,7 +145,7 @@ class RHUIManager():
         '''
         if enter_l:
             Expect.enter(connection, "l")
-        match = Expect.match(connection, re.compile("(.*)" + prompt, re.DOTALL))
+        match = Matcher.match(connection, re.compile("(.*)" + prompt, re.DOTALL))
         return match[0].splitlines()
 
     @staticmethod
@@ -49,15 +153,26 @@ class RHUIManager():
         '''
         Select list of items (multiple choice)
         '''
-        for value in value_list:
-            match = Expect.match(connection, re.compile(r".*-\s+([0-9]+)\s*:[^\n]*\s+" +
-                                                        re.escape(value) +
-                                                        r"\s*\n.*for more commands:.*", re.DOTALL))
-            Expect.enter(connection, match[0])
-            match = Expect.match(connection, re.compile(r".*x\s+([0-9]+)\s*:[^\n]*\s+" +
-                                                        re.escape(value) +
-                                                        r"\s*\n.*for more commands:.*", re.DOTALL))
-            Expect.enter(connection, "l")
+        # read the listing once, then toggle everything in one go and check the result once
+        listing = Matcher.match(connection, re.compile("(.*)" + MORE_COMMANDS, re.DOTALL))[0]
+        screen = SelectionScreen(listing.splitlines())
+        entries = [screen.find(value) for value in value_list]
+        missing = [value for value, entry in zip(value_list, entries) if not entry]
+        if missing:
+            raise ExpectFailed("Not available for selection: %s" % missing)
+        toggles = []
+        for entry in entries:
+            if not entry.selected:
+                # mark it so that it isn't toggled back if listed twice
+                entry.selected = True
+                toggles.append(entry.index)
+        # each toggle and the final "l" redraw the listing, followed by the prompt
+        Expect.enter(connection, "\n".join(toggles + ["l"]))
+        redraws = Matcher.collect(connection, MORE_COMMANDS, len(toggles) + 1, timeout=30)
+        final_screen = SelectionScreen(redraws.split(MORE_COMMANDS)[-2].splitlines())
+        unselected = [value for value in value_list if not final_screen.selected(value)]
+        if unselected:
+            raise ExpectFailed("Could not select: %s" % unselected)
         Expect.enter(connection, "c")
 
     @staticmethod
@@ -65,24 +180,28 @@ class RHUIManager():
         '''
         Select list of items (multiple choice)
         '''
+        # map the items to their on-screen indexes in one pass over the listing;
+        # items that aren't on the screen are skipped
         lines = RHUIManager.list_lines(connection, prompt=CONFIRM_PATTERN_STRING, enter_l=False)
+        screen = SelectionScreen(lines)
+        toggles = []
         for item in itemslist:
-            for line in lines:
-                if item in line:
-                    index = list(filter(str.isdigit, str(lines[lines.index(line)-1])))[0]
-                    Expect.enter(connection, index)
-                    break
-        Expect.enter(connection, "c")
+            entry = screen.search(item)
+            if entry and not entry.selected:
+                # mark it so that it isn't toggled back if listed twice
+                entry.selected = True
+                toggles.append(entry.index)
+        Expect.enter(connection, "\n".join(toggles + ["c"]))
 
     @staticmethod
     def select_one(connection, item):
         '''
         Select one item (single choice)
         '''
-        match = Expect.match(connection, re.compile(r".*([0-9]+)\s+-\s+" +
-                                                    item +
-                                                    r"\s*\n.*to abort:.*",
-                                                    re.DOTALL))
+        match = Matcher.match(connection, re.compile(r".*([0-9]+)\s+-\s+" +
+                                                     item +
+                                                     r"\s*\n.*to abort:.*",
+                                                     re.DOTALL))
         Expect.enter(connection, match[0])
 
     @staticmethod
@@ -90,9 +209,9 @@ class RHUIManager():
         '''
         Select all items
         '''
-        Expect.expect(connection, "Enter value .*:")
+        Matcher.expect(connection, "Enter value .*:")
         Expect.enter(connection, "a")
-        Expect.expect(connection, "Enter value .*:")
+        Matcher.expect(connection, "Enter value .*:")
         Expect.enter(connection, "c")
 
     @staticmethod
@@ -102,9 +221,19 @@ class RHUIManager():
 
         Use @param prefix to specify something to expect before exiting
         Use @param timeout to specify the timeout
+        In a running session, rhui-manager stays on the current screen.
         '''
-        Expect.expect(connection, prefix + r".*rhui \(.*\) =>", timeout)
-        Expect.enter(connection, "q")
+        Matcher.expect(connection, prefix + r".*rhui \(.*\) =>", timeout)
+        RHUIManager.leave(connection)
+
+    @staticmethod
+    def leave(connection):
+        '''
+        Quit from rhui-manager whose prompt has already been eaten,
+        or stay on the current screen if a session is running.
+        '''
+        if not RHUIManagerSession.active(connection):
+            Expect.enter(connection, "q")
 
     @staticmethod
     def logout(connection, prefix=""):
@@ -112,16 +241,21 @@ class RHUIManager():
         Logout from rhui-manager
 
         Use @param prefix to specify something to expect before exiting
+        This ends a running session, too.
         '''
-        Expect.expect(connection, prefix + r".*rhui \(.*\) =>")
+        Matcher.expect(connection, prefix + r".*rhui \(.*\) =>")
         Expect.enter(connection, "logout")
+        session = RHUIManagerSession.active(connection)
+        if session:
+            session.current_screen = None
+            session.stop()
 
     @staticmethod
     def proceed_without_check(connection):
         '''
         Proceed without check (avoid this function when possible!)
         '''
-        Expect.expect(connection, r"Proceed\? \(y/n\)")
+        Matcher.expect(connection, r"Proceed\? \(y/n\)")
         Expect.enter(connection, "y")
 
     @staticmethod
@@ -131,11 +265,11 @@ class RHUIManager():
 
         Use @param skip_list to skip meaningless 2nd-level headers
         '''
-        selected = Expect.match(connection,
-                                re.compile(".*" +
-                                           caption +
-                                           r"\r\n(.*)\r\nProceed\? \(y/n\).*",
-                                           re.DOTALL))[0].splitlines()
+        selected = Matcher.match(connection,
+                                 re.compile(".*" +
+                                            caption +
+                                            r"\r\n(.*)\r\nProceed\? \(y/n\).*",
+                                            re.DOTALL))[0].splitlines()
         selected_clean = []
         for val in selected:
             val = val.strip()
@@ -153,21 +287,17 @@ class RHUIManager():
     def screen(connection, screen_name):
         '''
         Open specified rhui-manager screen
+        (or switch to it if a session is running)
         '''
-        if screen_name in ["repo", "cds", "loadbalancers", "sync", "identity", "users"]:
-            key = screen_name[:1]
-        elif screen_name == "client":
-            key = "e"
-        elif screen_name == "entitlements":
-            key = "n"
-        elif screen_name == "subscriptions":
-            key = "sm"
-        else:
-            raise ValueError("Unsupported screen name: " + screen_name)
+        key = _screen_key(screen_name)
+        session = RHUIManagerSession.active(connection)
+        if session:
+            session.goto(screen_name)
+            return
         Expect.enter(connection, "rhui-manager")
-        Expect.expect(connection, r"rhui \(home\) =>")
+        Matcher.expect(connection, HOME_PROMPT)
         Expect.enter(connection, key)
-        Expect.expect(connection, r"rhui \(" + screen_name + r"\) =>")
+        Matcher.expect(connection, r"rhui \(" + screen_name + r"\) =>")
 
     @staticmethod
     def initial_run(connection, username="admin", password=""):
@@ -175,9 +305,9 @@ class RHUIManager():
         Run rhui-manager and make sure we're logged in, then quit it.
         '''
         Expect.enter(connection, "rhui-manager")
-        state = Expect.expect_list(connection,
-                                   [(re.compile(".*RHUI Username:.*", re.DOTALL), 1),
-                                    (re.compile(r".*rhui \(home\) =>.*", re.DOTALL), 2)])
+        state = Matcher.expect_list(connection,
+                                    [(re.compile(".*RHUI Username:.*", re.DOTALL), 1),
+                                     (re.compile(r".*rhui \(home\) =>.*", re.DOTALL), 2)])
         if state == 2:
         # Already logged in? No need to enter any password, just quit.
             Expect.enter(connection, "q")
@@ -192,15 +322,15 @@ class RHUIManager():
         attempts = len(attempted_passwords)
         for attempt, attempted_password in enumerate(attempted_passwords):
             Expect.enter(connection, username)
-            Expect.expect(connection, "RHUI Password:")
+            Matcher.expect(connection, "RHUI Password:")
             Expect.enter(connection, attempted_password)
-            password_state = Expect.expect_list(connection,
-                                                [(re.compile(".*Invalid login.*",
-                                                             re.DOTALL),
-                                                  1),
-                                                 (re.compile(r".*rhui \(home\) =>.*",
-                                                             re.DOTALL),
-                                                  2)])
+            password_state = Matcher.expect_list(connection,
+                                                 [(re.compile(".*Invalid login.*",
+                                                              re.DOTALL),
+                                                   1),
+                                                  (re.compile(r".*rhui \(home\) =>.*",
+                                                              re.DOTALL),
+                                                   2)])
             if password_state == 2:
             # this password worked; quit
                 Expect.enter(connection, "q")
@@ -230,13 +360,13 @@ class RHUIManager():
         rhua = ConMgr.get_rhua_hostname()
         RHUIManager.screen(connection, "users")
         Expect.enter(connection, "p")
-        Expect.expect(connection, "Username:")
+        Matcher.expect(connection, "Username:")
         Expect.enter(connection, 'admin')
-        Expect.expect(connection, "New Password:")
+        Matcher.expect(connection, "New Password:")
         Expect.enter(connection, password)
-        Expect.expect(connection, "Re-enter Password:")
+        Matcher.expect(connection, "Re-enter Password:")
         Expect.enter(connection, password)
-        Expect.expect(connection, "Password successfully updated")
+        Matcher.expect(connection, "Password successfully updated")
         # this action is supposed to log the admin out and thus delete the user cert
         Expect.expect_retval(connection, "test -f /root/.rhui/%s/user.crt" % rhua, 1)
 
@@ -253,6 +383,6 @@ class RHUIManager():
         '''
         check if the CA certificate expiration date is OK
         '''
-        Expect.ping_pong(connection,
-                         "rhui-manager status",
-                         "Entitlement CA certificate expiration date.*OK")
+        Matcher.ping_pong(connection,
+                          "rhui-manager status",
+                          "Entitlement CA certificate expiration date.*OK")
@@ -56,7 +56,7 @@ class RHUIManagerClient():
         Expect.expect(connection,
                       "Location: %s/%s-%s/build/RPMS/noarch/%s-%s-%s.noarch.rpm" % \
                       (dirname, rpmname, rpmversion, rpmname, rpmversion, rpmrelease))
-        Expect.enter(connection, "q")
+        RHUIManager.quit(connection)
 
     @staticmethod
     def create_container_conf_rpm(connection, dirname, rpmname, rpmversion="", rpmrelease="",
@@ -83,7 +83,7 @@ class RHUIManagerClient():
         Expect.expect(connection,
                       "Location: %s/%s-%s/build/RPMS/noarch/%s-%s-%s.noarch.rpm" % \
                       (dirname, rpmname, rpmversion, rpmname, rpmversion, rpmrelease))
-        Expect.enter(connection, "q")
+        RHUIManager.quit(connection)
 
     @staticmethod
     def create_atomic_conf_pkg(connection, dirname, tarname, certpath, certkey, port=""):
@@ -105,4 +105,4 @@ class RHUIManagerClient():
         Expect.expect(connection,
                       "Location: %s/%s.tar.gz" % \
                       (dirname, tarname))
-        Expect.enter(connection, "q")
+        RHUIManager.quit(connection)
@@ -2,43 +2,294 @@
 
 from os.path import basename, join
 import re
+import threading
 import time
 
 import nose
 
 from stitches.expect import Expect
+from rhui3_tests_lib import repo_list
+from rhui3_tests_lib.lines import iter_command, non_empty
+from rhui3_tests_lib.matcher import Matcher
+from rhui3_tests_lib.probe import Probe
+from rhui3_tests_lib.query_agent import QueryAgent
 from rhui3_tests_lib.util import Util
 
+# how long (in seconds) a status snapshot can be used before rhui-manager status is run again
+STATUS_TTL = 5
+# the status follows the repo name after anything but capital letters (spaces, colors, ...)
+STATUS_PATTERN = re.compile("[^A-Z]*([A-Za-z]*)")
+
+class RepoStatusSnapshot():
+    '''
+    The output of rhui-manager status, taken once and shared by all callers for a short time.
+    '''
+    # hostname -> the latest snapshot
+    _latest = {}
+    _lock = threading.Lock()
+
+    def __init__(self, output):
+        self.output = output
+        self.taken = time.time()
+        self._statuses = {}
+
+    @staticmethod
+    def get(connection, max_age=STATUS_TTL):
+        '''
+        return a snapshot of the status on the host, no older than max_age seconds
+        '''
+        with RepoStatusSnapshot._lock:
+            snapshot = RepoStatusSnapshot._latest.get(connection.hostname)
+            if not snapshot or time.time() - snapshot.taken > max_age:
+                _, stdout, _ = connection.exec_command("rhui-manager status")
+                snapshot = RepoStatusSnapshot(stdout.read().decode())
+                RepoStatusSnapshot._latest[connection.hostname] = snapshot
+            return snapshot
+
+    @staticmethod
+    def invalidate(connection):
+        '''
+        forget the snapshot of the status on the host (after a change)
+        '''
+        with RepoStatusSnapshot._lock:
+            RepoStatusSnapshot._latest.pop(connection.hostname, None)
+
+    def status(self, repo_name):
+        '''
+        return the status of the given repository (the word after the last mention of its name),
+        or None if the repository isn't in the output
+        '''
+        if repo_name not in self._statuses:
+            position = self.output.rfind(repo_name)
+            if position == -1:
+                return None
+            match = STATUS_PATTERN.match(self.output, position + len(repo_name))
+            self._statuses[repo_name] = match.group(1)
+        return self._statuses[repo_name]
+
+    def statuses(self, repo_names):
+        '''
+        return a repo name -> status dictionary for the given repositories
+        '''
+        return {repo_name: self.status(repo_name) for repo_name in repo_names}
+
+class RepoInfoIndex():
+    '''
+    Information about repos (rhui-manager repo info) loaded in bulk and memoized by repo ID.
+    The index is invalidated when repos are created or deleted with RHUIManagerCLI; use
+    RHUIManagerCLI.repo_info() for things that change otherwise, like the package count.
+    '''
+    # hostname -> {repo ID -> information}
+    _infos = {}
+    # the hosts for which all the repos are loaded
+    _complete = set()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def load(connection, repo_ids=None):
+        '''
+        load the information about the given repos (all repos by default) that isn't known yet,
+        with one rhui-manager process
+        '''
+        hostname = connection.hostname
+        if repo_ids is None:
+            if hostname in RepoInfoIndex._complete:
+                return
+            repo_ids = RHUIManagerCLI.repo_list(connection, ids_only=True).splitlines()
+            complete = True
+        else:
+            complete = False
+        with RepoInfoIndex._lock:
+            known = RepoInfoIndex._infos.setdefault(hostname, {})
+            missing = [repo_id for repo_id in repo_ids if repo_id not in known]
+        infos = RHUIManagerCLI.query_batch(connection,
+                                           [("repo_info", repo_id) for repo_id in missing])
+        with RepoInfoIndex._lock:
+            known = RepoInfoIndex._infos.setdefault(hostname, {})
+            known.update(zip(missing, infos))
+            if complete:
+                RepoInfoIndex._complete.add(hostname)
+
+    @staticmethod
+    def get(connection, repo_id):
+        '''
+        return the information about the repo with the given ID
+        '''
+        with RepoInfoIndex._lock:
+            info = RepoInfoIndex._infos.get(connection.hostname, {}).get(repo_id)
+        if info is None:
+            info = RHUIManagerCLI.repo_info(connection, repo_id)
+            with RepoInfoIndex._lock:
+                RepoInfoIndex._infos.setdefault(connection.hostname, {})[repo_id] = info
+        return info
+
+    @staticmethod
+    def all(connection):
+        '''
+        return a repo ID -> information dictionary for all the repos
+        '''
+        RepoInfoIndex.load(connection)
+        with RepoInfoIndex._lock:
+            return dict(RepoInfoIndex._infos[connection.hostname])
+
+    @staticmethod
+    def by_name(connection, name):
+        '''
+        return the information about the repo with the given (display) name, or None
+        '''
+        for info in RepoInfoIndex.all(connection).values():
+            if info["name"] == name:
+                return info
+        return None
+
+    @staticmethod
+    def by_path(connection, relative_path):
+        '''
+        return the information about the repo with the given relative path, or None
+        '''
+        for info in RepoInfoIndex.all(connection).values():
+            if info["relativepath"] == relative_path:
+                return info
+        return None
+
+    @staticmethod
+    def invalidate(connection, repo_id=None):
+        '''
+        forget the information about the given repo (all repos by default) on the host,
+        and the latest repo list
+        '''
+        repo_list.forget(connection)
+        with RepoInfoIndex._lock:
+            RepoInfoIndex._complete.discard(connection.hostname)
+            if repo_id is None:
+                RepoInfoIndex._infos.pop(connection.hostname, None)
+            else:
+                RepoInfoIndex._infos.get(connection.hostname, {}).pop(repo_id, None)
+
 def _get_repo_status(connection, repo_name):
     '''
     get the status of the given repository
     '''
-    Expect.enter(connection, "rhui-manager status")
-    status = Expect.match(connection, re.compile(".*%s[^A-Z]*([A-Za-z]*).*" % re.escape(repo_name),
-                                                 re.DOTALL))[0]
-    return status
+    return RepoStatusSnapshot.get(connection).status(repo_name)
 
-def _ent_list(stdout):
+def _iter_entitlements(lines):
     '''
-    return a list of entitlements based on the given output (produced by cert upload/info)
+    yield the entitlements from the given lines of output (produced by cert upload/info)
     '''
-    response = stdout.read().decode()
-    lines = list(map(str.lstrip, str(response).splitlines()))
+    lines = iter(lines)
     # there should be a header in the output, with status
+    header = [line.lstrip() for _, line in zip(range(3), lines)]
     try:
-        status = Util.uncolorify(lines[2])
+        status = Util.uncolorify(header[2])
     except IndexError:
-        raise RuntimeError("Unexpected output: %s" % response) from None
+        raise RuntimeError("Unexpected output: %s" % "\n".join(header)) from None
     if status == "Valid":
         # only pay attention to lines containing products
         # (which are non-empty lines below the header, without expriration and file name info)
-        entitlements = [line for line in lines[3:] if line and not line.startswith("Expiration")]
-        return entitlements
+        for line in lines:
+            line = line.lstrip()
+            if line and not line.startswith("Expiration"):
+                yield line
+        return
     if status in ("Expired", "No Red Hat entitlements found."):
-        # return an empty list
-        return []
+        # nothing to yield
+        return
     # if we're here, there's another problem with the entitlements/output
-    raise RuntimeError("An error occurred: %s" % response)
+    raise RuntimeError("An error occurred: %s" % "\n".join(header + list(lines)))
+
+def _ent_list(response):
+    '''
+    return a list of entitlements based on the given output (produced by cert upload/info)
+    '''
+    return list(_iter_entitlements(str(response).splitlines()))
+
+def _repo_info(repo_id, response):
+    '''
+    return a dictionary containing information about the given repo based on the given output
+    '''
+    all_lines = response.splitlines()
+    if all_lines[0] == "repository %s was not found" % repo_id:
+        raise RuntimeError("Invalid repository ID.")
+    info_pair_list = [line.split(":", 1) for line in all_lines]
+    info_dict = {i[0].replace(" ", "").lower(): i[1].lstrip() for i in info_pair_list}
+    return info_dict
+
+def _subscriptions(response, poolonly):
+    '''
+    return {labels: pool IDs} or [pool IDs] based on the given output (of subscriptions list)
+    '''
+    subs = response.splitlines()
+    # if "ESC" and some control characters are included, then RHBZ#1577052 has regressed
+    # if only pool IDs are requested, return their list as read from the output;
+    # otherwise, create and return a dict with subscription names and corresponding pool IDs
+    if poolonly:
+        return subs
+    labels = [l.replace("  Label: ", "") for l in subs if l.startswith("  Label")]
+    poolids = [p.replace("  Pool ID: ", "") for p in subs if p.startswith("  Pool")]
+    sub_dict = dict(zip(labels, poolids))
+    return sub_dict
+
+# the read-only commands which can also be run in a batch (see RHUIManagerCLI.query_batch());
+# each function returns the rhui-manager arguments and the parser of the output
+
+def _cert_info_query():
+    '''rhui-manager cert info'''
+    return ["cert", "info"], _ent_list
+
+def _repo_list_query(ids_only=False, redhat_only=False, delimiter=""):
+    '''rhui-manager repo list'''
+    argv = ["repo", "list"]
+    if ids_only:
+        argv.append("--ids_only")
+    if redhat_only:
+        argv.append("--redhat_only")
+    if delimiter:
+        argv.extend(["--delimiter", delimiter])
+    return argv, str.strip
+
+def _repo_info_query(repo_id):
+    '''rhui-manager repo info'''
+    return ["repo", "info", "--repo_id", repo_id], lambda response: _repo_info(repo_id, response)
+
+def _packages_list_query(repo_id):
+    '''rhui-manager packages list'''
+    return ["packages", "list", "--repo_id", repo_id], str.splitlines
+
+def _client_labels_query():
+    '''rhui-manager client labels'''
+    return ["client", "labels"], str.splitlines
+
+def _subscriptions_list_query(what="registered", poolonly=False):
+    '''rhui-manager subscriptions list'''
+    allowed_lists = ["registered", "available"]
+    if what not in allowed_lists:
+        raise ValueError("Unsupported list: '%s'. Use one of: %s." % (what, allowed_lists))
+    argv = ["subscriptions", "list", "--%s" % what]
+    if poolonly:
+        argv.append("--pool-only")
+    return argv, lambda response: _subscriptions(response, poolonly)
+
+QUERIES = {"cert_info": _cert_info_query,
+           "repo_list": _repo_list_query,
+           "repo_info": _repo_info_query,
+           "packages_list": _packages_list_query,
+           "client_labels": _client_labels_query,
+           "subscriptions_list": _subscriptions_list_query}
+
+def _iter_query(connection, name, *args):
+    '''
+    run one query, yield the lines of its output as they are read
+    '''
+    argv, _ = QUERIES[name](*args)
+    return iter_command(connection, "rhui-manager " + " ".join(argv))
+
+def _run_query(connection, name, *args):
+    '''
+    run one query with its own rhui-manager process, return the parsed output
+    '''
+    argv, parser = QUERIES[name](*args)
+    _, stdout, _ = connection.exec_command("rhui-manager " + " ".join(argv))
+    return parser(stdout.read().decode())
 
 class CustomRepoAlreadyExists(Exception):
     '''
@@ -54,6 +305,18 @@ class RHUIManagerCLI():
     '''
     The RHUI manager command-line interface (shell commands to control the RHUA).
     '''
+    @staticmethod
+    def query_batch(connection, queries, timeout=300):
+        '''
+        answer many read-only queries with one rhui-manager process on the RHUA;
+        the queries are tuples with a method name and its arguments, for example:
+        [("repo_info", "repo1"), ("packages_list", "repo1"), ("client_labels",)];
+        return a list of results, as the methods would return them
+        '''
+        built = [QUERIES[query[0]](*query[1:]) for query in queries]
+        answers = QueryAgent.run(connection, [argv for argv, _ in built], timeout)
+        return [parser(answer["stdout"]) for (_, parser), answer in zip(built, answers)]
+
     @staticmethod
     def cert_upload(connection, cert="/tmp/extra_rhui_files/rhcert.pem"):
         '''
@@ -61,15 +324,21 @@ class RHUIManagerCLI():
         '''
         # get the complete output and split it into (left-stripped) lines
         _, stdout, _ = connection.exec_command("rhui-manager cert upload --cert %s" % cert)
-        return _ent_list(stdout)
+        return _ent_list(stdout.read().decode())
 
     @staticmethod
     def cert_info(connection):
         '''
         return a list of valid entitlements (if any)
         '''
-        _, stdout, _ = connection.exec_command("rhui-manager cert info")
-        return _ent_list(stdout)
+        return _run_query(connection, "cert_info")
+
+    @staticmethod
+    def iter_cert_info(connection):
+        '''
+        yield valid entitlements (if any) as they are read
+        '''
+        return _iter_entitlements(_iter_query(connection, "cert_info"))
 
     @staticmethod
     def repo_unused(connection, by_repo_id=False):
@@ -91,44 +360,46 @@ class RHUIManagerCLI():
         '''
         add a repo specified by its product name
         '''
-        Expect.ping_pong(connection,
-                         "rhui-manager repo add --product_name \"" + repo + "\"",
-                         "Successfully added")
+        Matcher.ping_pong(connection,
+                          "rhui-manager repo add --product_name \"" + repo + "\"",
+                          "Successfully added")
+        RepoInfoIndex.invalidate(connection)
 
     @staticmethod
     def repo_add_by_repo(connection, repo_ids):
         '''
         add a repo specified by its ID
         '''
-        Expect.ping_pong(connection,
-                         "rhui-manager repo add_by_repo --repo_ids " + ",".join(repo_ids),
-                         "Successfully added",
-                         timeout=300)
+        Matcher.ping_pong(connection,
+                          "rhui-manager repo add_by_repo --repo_ids " + ",".join(repo_ids),
+                          "Successfully added",
+                          timeout=300)
+        for repo_id in repo_ids:
+            RepoInfoIndex.invalidate(connection, repo_id)
 
     @staticmethod
     def repo_list(connection, ids_only=False, redhat_only=False, delimiter=""):
         '''
         show repos; can show IDs only, RH repos only, and accepts a delimiter
         '''
-        cmd = "rhui-manager repo list"
-        if ids_only:
-            cmd += " --ids_only"
-        if redhat_only:
-            cmd += " --redhat_only"
-        if delimiter:
-            cmd += " --delimiter %s" % delimiter
-        _, stdout, _ = connection.exec_command(cmd)
-        response = stdout.read().decode().strip()
-        return response
+        return _run_query(connection, "repo_list", ids_only, redhat_only, delimiter)
+
+    @staticmethod
+    def iter_repo_list(connection, ids_only=False, redhat_only=False, delimiter=""):
+        '''
+        yield the (non-empty) lines of the repo list as they are read
+        '''
+        return non_empty(_iter_query(connection, "repo_list", ids_only, redhat_only, delimiter))
 
     @staticmethod
     def repo_sync(connection, repo_id, repo_name):
         '''
         sync a repo
         '''
-        Expect.ping_pong(connection,
-                         "rhui-manager repo sync --repo_id " + repo_id,
-                         "successfully scheduled for the next available timeslot")
+        Matcher.ping_pong(connection,
+                          "rhui-manager repo sync --repo_id " + repo_id,
+                          "successfully scheduled for the next available timeslot")
+        RepoStatusSnapshot.invalidate(connection)
         repo_status = _get_repo_status(connection, repo_name)
         while repo_status in ["Never", "Running", "Unknown"]:
             time.sleep(10)
@@ -140,13 +411,7 @@ class RHUIManagerCLI():
         '''
         return a dictionary containing information about the given repo
         '''
-        _, stdout, _ = connection.exec_command("rhui-manager repo info --repo_id %s" % repo_id)
-        all_lines = stdout.read().decode().splitlines()
-        if all_lines[0] == "repository %s was not found" % repo_id:
-            raise RuntimeError("Invalid repository ID.")
-        info_pair_list = [line.split(":", 1) for line in all_lines]
-        info_dict = {i[0].replace(" ", "").lower(): i[1].lstrip() for i in info_pair_list}
-        return info_dict
+        return _run_query(connection, "repo_info", repo_id)
 
     @staticmethod
     def repo_create_custom(connection,
@@ -179,7 +444,8 @@ class RHUIManagerCLI():
             cmd += " --gpg_public_keys %s" % gpg_public_keys
         # get a list of invalid GPG key files (will be implicitly empty if that option isn't used)
         key_list = gpg_public_keys.split(",")
-        bad_keys = [key for key in key_list if connection.recv_exit_status("test -f %s" % key)]
+        keys_exist = Probe.files_exist(connection, key_list)
+        bad_keys = [key for key in key_list if not keys_exist[key]]
         # possible output (more or less specific):
         out = {"missing_options": "Usage:",
                "invalid_id": "Only.*valid in a repository ID",
@@ -188,12 +454,12 @@ class RHUIManagerCLI():
                "success": "Successfully created repository \"%s\"" % (display_name or repo_id)}
         # run the command and see what happens
         Expect.enter(connection, cmd)
-        state = Expect.expect_list(connection,
-                                   [(re.compile(".*%s.*" % out["missing_options"], re.DOTALL), 1),
-                                    (re.compile(".*%s.*" % out["invalid_id"], re.DOTALL), 2),
-                                    (re.compile(".*%s.*" % out["repo_exists"], re.DOTALL), 3),
-                                    (re.compile(".*%s.*" % out["bad_gpg"], re.DOTALL), 4),
-                                    (re.compile(".*%s.*" % out["success"], re.DOTALL), 5)])
+        state = Matcher.expect_list(connection,
+                                    [(re.compile(".*%s.*" % out["missing_options"], re.DOTALL), 1),
+                                     (re.compile(".*%s.*" % out["invalid_id"], re.DOTALL), 2),
+                                     (re.compile(".*%s.*" % out["repo_exists"], re.DOTALL), 3),
+                                     (re.compile(".*%s.*" % out["bad_gpg"], re.DOTALL), 4),
+                                     (re.compile(".*%s.*" % out["success"], re.DOTALL), 5)])
         if state in (1, 2):
             raise ValueError("the given repo ID is unusable")
         if state == 3:
@@ -202,6 +468,7 @@ class RHUIManagerCLI():
             raise CustomRepoGpgKeyNotFound()
         # make sure rhui-manager reported success
         nose.tools.assert_equal(state, 5)
+        RepoInfoIndex.invalidate(connection, repo_id)
 
     @staticmethod
     def repo_delete(connection, repo_id):
@@ -209,6 +476,7 @@ class RHUIManagerCLI():
         delete the given repo
         '''
         Expect.expect_retval(connection, "rhui-manager repo delete --repo_id %s" % repo_id)
+        RepoInfoIndex.invalidate(connection, repo_id)
 
     @staticmethod
     def repo_add_errata(connection, repo_id, updateinfo):
@@ -235,8 +503,15 @@ class RHUIManagerCLI():
         '''
         return a list of packages present in the repo
         '''
-        _, stdout, _ = connection.exec_command("rhui-manager packages list --repo_id %s" % repo_id)
-        return stdout.read().decode().splitlines()
+        return _run_query(connection, "packages_list", repo_id)
+
+    @staticmethod
+    def iter_packages_list(connection, repo_id):
+        '''
+        yield the packages present in the repo as they are read; filter them with the functions
+        in the lines module, e.g. lines.nevras(RHUIManagerCLI.iter_packages_list(...))
+        '''
+        return _iter_query(connection, "packages_list", repo_id)
 
     @staticmethod
     def packages_remote(connection, repo_id, url):
@@ -282,19 +557,24 @@ class RHUIManagerCLI():
         '''
         view repo labels in the RHUA; returns a list of the labels
         '''
-        _, stdout, _ = connection.exec_command("rhui-manager client labels")
-        labels = stdout.read().decode().splitlines()
-        return labels
+        return _run_query(connection, "client_labels")
+
+    @staticmethod
+    def iter_client_labels(connection):
+        '''
+        yield the repo labels in the RHUA as they are read
+        '''
+        return _iter_query(connection, "client_labels")
 
     @staticmethod
     def client_cert(connection, repo_labels, name, days, directory):
         '''
         generate an entitlement certificate
         '''
-        Expect.ping_pong(connection,
-                         "rhui-manager client cert --repo_label %s " % ",".join(repo_labels) +
-                         "--name %s --days %s --dir %s" % (name, str(days), directory),
-                         "Entitlement certificate created at %s/%s.crt" % (directory, name))
+        Matcher.ping_pong(connection,
+                          "rhui-manager client cert --repo_label %s " % ",".join(repo_labels) +
+                          "--name %s --days %s --dir %s" % (name, str(days), directory),
+                          "Entitlement certificate created at %s/%s.crt" % (directory, name))
 
     @staticmethod
     def client_rpm(connection, certdata, rpmdata, directory, unprotected_repos=None, proxy=""):
@@ -333,10 +613,10 @@ class RHUIManagerCLI():
             cmd += " --unprotected_repos %s" % ",".join(unprotected_repos)
         if proxy:
             cmd += " --proxy %s" % proxy
-        Expect.ping_pong(connection,
-                         cmd,
-                         "Location: %s/%s-%s/build/RPMS/noarch/%s-%s-%s.noarch.rpm" % \
-                         (directory, rpmdata[0], rpmdata[1], rpmdata[0], rpmdata[1], rpmdata[2]))
+        Matcher.ping_pong(connection,
+                          cmd,
+                          "Location: %s/%s-%s/build/RPMS/noarch/%s-%s-%s.noarch.rpm" % \
+                          (directory, rpmdata[0], rpmdata[1], rpmdata[0], rpmdata[1], rpmdata[2]))
 
     @staticmethod
     def client_content_source(connection, certdata, rpmdata, directory):
@@ -358,33 +638,17 @@ class RHUIManagerCLI():
         else:
             rpmdata.append("2.0")
         cmd += " --dir %s" % directory
-        Expect.ping_pong(connection,
-                         cmd,
-                         "Location: %s/%s-%s/build/RPMS/noarch/%s-%s-1.noarch.rpm" % \
-                         (directory, rpmdata[0], rpmdata[1], rpmdata[0], rpmdata[1]))
+        Matcher.ping_pong(connection,
+                          cmd,
+                          "Location: %s/%s-%s/build/RPMS/noarch/%s-%s-1.noarch.rpm" % \
+                          (directory, rpmdata[0], rpmdata[1], rpmdata[0], rpmdata[1]))
 
     @staticmethod
     def subscriptions_list(connection, what="registered", poolonly=False):
         '''
         list registered or available subscriptions, {labels: pool IDs} or [pool IDs]
         '''
-        allowed_lists = ["registered", "available"]
-        if what not in allowed_lists:
-            raise ValueError("Unsupported list: '%s'. Use one of: %s." % (what, allowed_lists))
-        cmd = "rhui-manager subscriptions list --%s" % what
-        if poolonly:
-            cmd += " --pool-only"
-        _, stdout, _ = connection.exec_command(cmd)
-        subs = stdout.read().decode().splitlines()
-        # if "ESC" and some control characters are included, then RHBZ#1577052 has regressed
-        # if only pool IDs are requested, return their list as read from the output;
-        # otherwise, create and return a dict with subscription names and corresponding pool IDs
-        if poolonly:
-            return subs
-        labels = [l.replace("  Label: ", "") for l in subs if l.startswith("  Label")]
-        poolids = [p.replace("  Pool ID: ", "") for p in subs if p.startswith("  Pool")]
-        sub_dict = dict(zip(labels, poolids))
-        return sub_dict
+        return _run_query(connection, "subscriptions_list", what, poolonly)
 
     @staticmethod
     def subscriptions_register(connection, pool):
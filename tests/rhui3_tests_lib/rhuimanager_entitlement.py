@@ -33,7 +33,7 @@ class RHUIManagerEntitlements():
         '''
         RHUIManager.screen(connection, "entitlements")
         lines = RHUIManager.list_lines(connection, prompt=PROMPT)
-        Expect.enter(connection, 'q')
+        RHUIManager.leave(connection)
         return lines
 
     @staticmethod
@@ -47,7 +47,7 @@ class RHUIManagerEntitlements():
         match = Expect.match(connection, re.compile("(.*)" + PROMPT, re.DOTALL))[0]
         entitlements_list = [line.strip() for line in match.splitlines()
                              if line.startswith("    ") and not line.endswith(".pem")]
-        Expect.enter(connection, 'q')
+        RHUIManager.leave(connection)
         return entitlements_list
 
 
@@ -62,7 +62,7 @@ class RHUIManagerEntitlements():
         match = Expect.match(connection, re.compile("(.*)" + PROMPT, re.DOTALL))[0]
         repo_list = [line.replace("Name:", "").strip() for line in match.splitlines()
                      if "Name:" in line]
-        Expect.enter(connection, 'q')
+        RHUIManager.leave(connection)
         return repo_list
 
     @staticmethod
@@ -90,14 +90,14 @@ class RHUIManagerEntitlements():
         matched_string = match[0].replace('l\r\n\r\nRed Hat Entitlements\r\n\r\n  ' +
                                           '\x1b[92mValid\x1b[0m\r\n    ', '', 1)
         if bad_cert_msg in matched_string:
-            Expect.enter(connection, 'q')
+            RHUIManager.leave(connection)
             raise BadCertificate()
         if incompatible_cert_msg in matched_string:
-            Expect.enter(connection, 'q')
+            RHUIManager.leave(connection)
             raise IncompatibleCertificate()
         entitlements_list = []
         pattern = re.compile('(.*?\r\n.*?pem)', re.DOTALL)
         for entitlement in pattern.findall(matched_string):
             entitlements_list.append(entitlement.strip())
-        Expect.enter(connection, 'q')
+        RHUIManager.leave(connection)
         return entitlements_list
@@ -89,7 +89,7 @@ class RHUIManagerInstance():
         if state == 1:
             # don't know how to continue with invalid path: raise an exception
             Expect.enter(connection, CTRL_C)
-            Expect.enter(connection, "q")
+            RHUIManager.quit(connection)
             raise InvalidSshKeyPath(ssh_key_path)
         # all OK
         # if the SSH key is unknown, rhui-manager now asks you to confirm it; say yes
@@ -140,5 +140,5 @@ class RHUIManagerInstance():
         # eating prompt!!
         lines = RHUIManager.list_lines(connection, r"rhui \(" + screen + r"\) => ")
         ret = Instance.parse(lines)
-        Expect.enter(connection, 'q')
+        RHUIManager.leave(connection)
         return [cds for _, cds in ret]
@@ -8,7 +8,12 @@ import nose
 
 from stitches.expect import CTRL_C, Expect
 
+from rhui3_tests_lib import repo_list
 from rhui3_tests_lib.helpers import Helpers
+from rhui3_tests_lib.matcher import Matcher
+from rhui3_tests_lib.package_index import PackageIndex
+from rhui3_tests_lib.repo_list import RepoList
+from rhui3_tests_lib.rhuimanager_cmdline import RepoInfoIndex
 from rhui3_tests_lib.util import Util
 from rhui3_tests_lib.rhuimanager import RHUIManager
 
@@ -37,39 +42,39 @@ class RHUIManagerRepo():
         '''
         RHUIManager.screen(connection, "repo")
         Expect.enter(connection, "c")
-        Expect.expect(connection, "Unique ID for the custom repository.*:")
+        Matcher.expect(connection, "Unique ID for the custom repository.*:")
         Expect.enter(connection, reponame)
         checklist = ["ID: " + reponame]
-        state = Expect.expect_list(connection,
-                                   [(re.compile(".*Display name for the custom repository.*:",
-                                                re.DOTALL),
-                                     1),
-                                    (re.compile(".*repository.*already exists.*Unique ID.*:",
-                                                re.DOTALL),
-                                     2)])
+        state = Matcher.expect_list(connection,
+                                    [(re.compile(".*Display name for the custom repository.*:",
+                                                 re.DOTALL),
+                                      1),
+                                     (re.compile(".*repository.*already exists.*Unique ID.*:",
+                                                 re.DOTALL),
+                                      2)])
         if state == 1:
             Expect.enter(connection, displayname)
             if displayname != "":
                 checklist.append("Name: " + displayname)
             else:
                 checklist.append("Name: " + reponame)
-            Expect.expect(connection, "Unique path at which the repository will be served.*:")
+            Matcher.expect(connection, "Unique path at which the repository will be served.*:")
             Expect.enter(connection, path)
             if path != "":
                 path_real = path
             else:
                 path_real = reponame
             checklist.append("Path: " + path_real)
-            Expect.expect(connection, "Enter value.*:")
+            Matcher.expect(connection, "Enter value.*:")
             Expect.enter(connection, checksum_alg)
-            Expect.expect(connection,
-                          "Should the repository require an entitlement certificate " +
-                          r"to access\? \(y/n\)")
+            Matcher.expect(connection,
+                           "Should the repository require an entitlement certificate " +
+                           r"to access\? \(y/n\)")
             Expect.enter(connection, entitlement)
             if entitlement == "y":
-                Expect.expect(connection,
-                              "Path that should be used when granting an entitlement " +
-                              "for this repository.*:")
+                Matcher.expect(connection,
+                               "Path that should be used when granting an entitlement " +
+                               "for this repository.*:")
                 Expect.enter(connection, entitlement_path)
                 if entitlement_path != "":
                     checklist.append("Entitlement: " + entitlement_path)
@@ -79,28 +84,28 @@ class RHUIManagerRepo():
                         # bug 815975
                         educated_guess = path_real
                     checklist.append("Entitlement: " + educated_guess)
-            Expect.expect(connection, r"packages are signed by a GPG key\? \(y/n\)")
+            Matcher.expect(connection, r"packages are signed by a GPG key\? \(y/n\)")
             if redhat_gpg == "y" or custom_gpg:
                 Expect.enter(connection, "y")
                 checklist.append("GPG Check Yes")
-                Expect.expect(connection,
-                              "Will the repository be used to host any " +
-                              r"Red Hat GPG signed content\? \(y/n\)")
+                Matcher.expect(connection,
+                               "Will the repository be used to host any " +
+                               r"Red Hat GPG signed content\? \(y/n\)")
                 Expect.enter(connection, redhat_gpg)
                 if redhat_gpg == "y":
                     checklist.append("Red Hat GPG Key: Yes")
                 else:
                     checklist.append("Red Hat GPG Key: No")
-                Expect.expect(connection,
-                              "Will the repository be used to host any " +
-                              r"custom GPG signed content\? \(y/n\)")
+                Matcher.expect(connection,
+                               "Will the repository be used to host any " +
+                               r"custom GPG signed content\? \(y/n\)")
                 if custom_gpg:
                     Expect.enter(connection, "y")
-                    Expect.expect(connection,
-                                  "Enter the absolute path to the public key of the GPG keypair:")
+                    Matcher.expect(connection,
+                                   "Enter the absolute path to the public key of the GPG keypair:")
                     Expect.enter(connection, custom_gpg)
-                    Expect.expect(connection,
-                                  r"Would you like to enter another public key\? \(y/n\)")
+                    Matcher.expect(connection,
+                                   r"Would you like to enter another public key\? \(y/n\)")
                     Expect.enter(connection, "n")
                     checklist.append("Custom GPG Keys: '" + custom_gpg + "'")
                 else:
@@ -115,6 +120,7 @@ class RHUIManagerRepo():
                                            "The following repository will be created:",
                                            checklist)
             RHUIManager.quit(connection, "Successfully created repository *")
+            RepoInfoIndex.invalidate(connection)
         else:
             Expect.enter(connection, CTRL_C)
             RHUIManager.quit(connection)
@@ -127,10 +133,11 @@ class RHUIManagerRepo():
         '''
         RHUIManager.screen(connection, "repo")
         Expect.enter(connection, "a")
-        Expect.expect(connection, "Import Repositories:.*to abort:", 660)
+        Matcher.expect(connection, "Import Repositories:.*to abort:", 660)
         Expect.enter(connection, "1")
         RHUIManager.proceed_without_check(connection)
         RHUIManager.quit(connection, "", 180)
+        RepoInfoIndex.invalidate(connection)
 
     @staticmethod
     def add_rh_repo_by_product(connection, productlist):
@@ -139,13 +146,14 @@ class RHUIManagerRepo():
         '''
         RHUIManager.screen(connection, "repo")
         Expect.enter(connection, "a")
-        Expect.expect(connection, "Import Repositories:.*to abort:", 660)
+        Matcher.expect(connection, "Import Repositories:.*to abort:", 660)
         Expect.enter(connection, "2")
         RHUIManager.select(connection, productlist)
         RHUIManager.proceed_with_check(connection,
                                        "The following products will be deployed:",
                                        productlist)
         RHUIManager.quit(connection)
+        RepoInfoIndex.invalidate(connection)
 
     @staticmethod
     def add_rh_repo_by_repo(connection, repolist):
@@ -154,7 +162,7 @@ class RHUIManagerRepo():
         '''
         RHUIManager.screen(connection, "repo")
         Expect.enter(connection, "a")
-        Expect.expect(connection, "Import Repositories:.*to abort:", 660)
+        Matcher.expect(connection, "Import Repositories:.*to abort:", 660)
         Expect.enter(connection, "3")
         RHUIManager.select(connection, repolist)
         repolist_mod = list(repolist)
@@ -168,6 +176,7 @@ class RHUIManagerRepo():
                                        "The following product repositories will be deployed:",
                                        repolist_mod)
         RHUIManager.quit(connection)
+        RepoInfoIndex.invalidate(connection)
 
     @staticmethod
     def add_container(connection, containername, containerid="", displayname="", credentials=""):
@@ -183,25 +192,25 @@ class RHUIManagerRepo():
         # this method will fail otherwise, because it will expect rhui-manager to ask for them
         RHUIManager.screen(connection, "repo")
         Expect.enter(connection, "ad")
-        Expect.expect(connection, "Specify URL of registry .*:")
+        Matcher.expect(connection, "Specify URL of registry .*:")
         if credentials and credentials[0]:
             registry = credentials[0]
             Expect.enter(connection, registry)
         else:
             registry = default_registry
             Expect.enter(connection, "")
-        Expect.expect(connection, "Name of the container in the registry:")
+        Matcher.expect(connection, "Name of the container in the registry:")
         Expect.enter(connection, containername)
-        Expect.expect(connection, "Unique ID for the container .*]", 60)
+        Matcher.expect(connection, "Unique ID for the container .*]", 60)
         Expect.enter(connection, containerid)
-        Expect.expect(connection, "Display name for the container.*]:")
+        Matcher.expect(connection, "Display name for the container.*]:")
         Expect.enter(connection, displayname)
         # login & password provided, or a non-default registry specified
         if credentials or registry != default_registry:
-            Expect.expect(connection, "Registry username:")
+            Matcher.expect(connection, "Registry username:")
             if len(credentials) > 2:
                 Expect.enter(connection, credentials[1])
-                Expect.expect(connection, "Registry password:")
+                Matcher.expect(connection, "Registry password:")
                 Expect.enter(connection, credentials[2])
             else:
                 Expect.enter(connection, "")
@@ -216,48 +225,57 @@ class RHUIManagerRepo():
                                         "Display Name: " + displayname,
                                         "Upstream Container Name: " + containername])
         RHUIManager.quit(connection)
+        RepoInfoIndex.invalidate(connection)
 
     @staticmethod
     def list(connection):
         '''
-        list repositories
+        list repositories; return a RepoList of Repo strings
         '''
         RHUIManager.screen(connection, "repo")
         Expect.enter(connection, "l")
         # eating prompt!!
         pattern = re.compile(r'l\r\n(.*)\r\n-+\r\nrhui\s* \(repo\)\s* =>',
                              re.DOTALL)
-        ret = Expect.match(connection, pattern, grouplist=[1])[0]
-        reslist = map(str.strip, str(ret).splitlines())
-        repolist = []
-        for line in reslist:
-            if line in ["",
-                        "Custom Repositories",
-                        "Red Hat Repositories",
-                        "OSTree",
-                        "Docker",
-                        "Yum",
-                        "No repositories are currently managed by the RHUI"]:
-                continue
-            repolist.append(line)
-        Expect.enter(connection, 'q')
-        return repolist
+        ret = Matcher.match(connection, pattern, grouplist=[1])[0]
+        RHUIManager.leave(connection)
+        repos = RepoList.parse(str(ret).splitlines())
+        repo_list.remember(connection, repos)
+        return repos
+
+    @staticmethod
+    def listing(connection):
+        '''
+        return the latest RepoList, or list repositories if they may have changed since then
+        '''
+        repos = repo_list.latest(connection)
+        if repos is None:
+            repos = RHUIManagerRepo.list(connection)
+        return repos
 
     @staticmethod
     def get_repo_version(connection, reponame):
         '''
         get repo version
         '''
-        repolist = RHUIManagerRepo.list(connection)
         # delete escape back slash from the reponame
         reponame = reponame.replace("\\", "")
-        # get full repo name with its version from the list of all repos
-        full_reponame = next((s for s in repolist if reponame in s), None)
-        #return full_reponame
-        # get its version
-        repo_version = re.sub(r'^.*\((.*?)\)[^\(]*$', r'\g<1>', full_reponame)
+        return RHUIManagerRepo.listing(connection).find(reponame).version
 
-        return repo_version
+    @staticmethod
+    def get_repo_kind(connection, reponame):
+        '''
+        get repo kind (Custom, Docker, OSTree, or Yum)
+        '''
+        reponame = reponame.replace("\\", "")
+        return RHUIManagerRepo.listing(connection).find(reponame).kind
+
+    @staticmethod
+    def repo_exists(connection, reponame):
+        '''
+        check if a repo with the given name (with or without the version) is listed
+        '''
+        return RHUIManagerRepo.listing(connection).get(reponame) is not None
 
     @staticmethod
     def delete_repo(connection, repolist):
@@ -269,6 +287,7 @@ class RHUIManagerRepo():
         RHUIManager.select(connection, repolist)
         RHUIManager.proceed_without_check(connection)
         RHUIManager.quit(connection)
+        RepoInfoIndex.invalidate(connection)
 
     @staticmethod
     def delete_all_repos(connection):
@@ -277,19 +296,20 @@ class RHUIManagerRepo():
         '''
         RHUIManager.screen(connection, "repo")
         Expect.enter(connection, "d")
-        status = Expect.expect_list(connection,
-                                    [(re.compile(".*No repositories.*", re.DOTALL), 1),
-                                     (re.compile(".*Enter value.*", re.DOTALL), 2)],
-                                    360)
+        status = Matcher.expect_list(connection,
+                                     [(re.compile(".*No repositories.*", re.DOTALL), 1),
+                                      (re.compile(".*Enter value.*", re.DOTALL), 2)],
+                                     360)
         if status == 1:
             RHUIManager.quit(connection)
             return
         Expect.enter(connection, "a")
-        Expect.expect(connection, "Enter value .*:")
+        Matcher.expect(connection, "Enter value .*:")
         Expect.enter(connection, "c")
         RHUIManager.proceed_without_check(connection)
         # Wait until all repos are deleted
         RHUIManager.quit(connection, "", 360)
+        RepoInfoIndex.invalidate(connection)
         while RHUIManagerRepo.list(connection):
             time.sleep(10)
 
@@ -315,7 +335,7 @@ class RHUIManagerRepo():
         RHUIManager.screen(connection, "repo")
         Expect.enter(connection, "u")
         RHUIManager.select(connection, repolist)
-        Expect.expect(connection, "will be uploaded:")
+        Matcher.expect(connection, "will be uploaded:")
         Expect.enter(connection, path)
         RHUIManager.proceed_with_check(connection, "The following RPMs will be uploaded:", content)
         RHUIManager.quit(connection, timeout=60)
@@ -332,7 +352,7 @@ class RHUIManagerRepo():
         RHUIManager.screen(connection, "repo")
         Expect.enter(connection, "ur")
         RHUIManager.select(connection, repolist)
-        Expect.expect(connection, "will be uploaded:")
+        Matcher.expect(connection, "will be uploaded:")
         Expect.enter(connection, url)
         if rpms:
             RHUIManager.proceed_with_check(connection, "The following RPMs will be uploaded:", rpms)
@@ -347,12 +367,12 @@ class RHUIManagerRepo():
         Expect.enter(connection, "p")
 
         RHUIManager.select_one(connection, reponame)
-        Expect.expect(connection, r"\(blank line for no filter\):")
+        Matcher.expect(connection, r"\(blank line for no filter\):")
         Expect.enter(connection, package)
 
         pattern = re.compile(r'.*only\.\r\n(.*)\r\n-+\r\nrhui\s* \(repo\)\s* =>',
                              re.DOTALL)
-        ret = Expect.match(connection, pattern, grouplist=[1])[0]
+        ret = Matcher.match(connection, pattern, grouplist=[1])[0]
         reslist = map(str.strip, str(ret).splitlines())
         packagelist = []
         for line in reslist:
@@ -365,9 +385,24 @@ class RHUIManagerRepo():
             if line == 'No packages in the repository.':
                 continue
             packagelist.append(line)
-        Expect.enter(connection, 'q')
+        RHUIManager.leave(connection)
         return packagelist
 
+    @staticmethod
+    def published_packages(connection, repo_id, package=""):
+        '''
+        list packages in a repository, like check_for_package(), but read them from the published
+        primary.xml file (which is much faster for big repos, and the list isn't truncated)
+        '''
+        return PackageIndex.from_repo(connection, repo_id).filenames_matching(package)
+
+    @staticmethod
+    def published_package_count(connection, repo_id):
+        '''
+        return the number of packages in the published primary.xml file of a repository
+        '''
+        return PackageIndex.from_repo(connection, repo_id).count
+
     @staticmethod
     def check_detailed_information(connection, repo_data, type_data, gpg_data, package_count):
         '''
@@ -388,8 +423,8 @@ class RHUIManagerRepo():
         Expect.enter(connection, "i")
         RHUIManager.select(connection, [repo_data[0]])
         pattern = re.compile(r".*(Name:.*)\r\n\r\n-+\r\nrhui\s* \(repo\)\s* =>", re.DOTALL)
-        actual_responses = Expect.match(connection, pattern)[0].splitlines()
-        Expect.enter(connection, "q")
+        actual_responses = Matcher.match(connection, pattern)[0].splitlines()
+        RHUIManager.leave(connection)
         expected_responses = ["Name:                " + repo_data[0]]
         if type_data[0]:
             repo_type = "Custom"
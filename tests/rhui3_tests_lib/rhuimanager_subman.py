@@ -2,7 +2,7 @@
 
 import re
 
-from stitches.expect import Expect, ExpectFailed
+from stitches.expect import CTRL_C, Expect, ExpectFailed
 from rhui3_tests_lib.rhuimanager import RHUIManager
 
 PROMPT = r"rhui \(subscriptions\) => "
@@ -24,7 +24,7 @@ class RHUIManagerSubMan():
         lines = Expect.match(connection, re.compile("(.*)" + PROMPT, re.DOTALL))[0]
         # subscription names are on lines that start with two spaces
         sub_list = [line.strip() for line in lines.splitlines() if line.startswith("  ")]
-        Expect.enter(connection, "q")
+        RHUIManager.leave(connection)
         return sub_list
 
     @staticmethod
@@ -35,7 +35,8 @@ class RHUIManagerSubMan():
         try:
             RHUIManager.select(connection, names)
         except ExpectFailed:
-            Expect.enter(connection, "q")
+            Expect.enter(connection, CTRL_C)
+            RHUIManager.quit(connection)
             raise RuntimeError("subscription(s) not available: %s" % names) from None
         RHUIManager.proceed_with_check(connection,
                                        "The following subscriptions will be registered:",
@@ -50,7 +51,8 @@ class RHUIManagerSubMan():
         try:
             RHUIManager.select(connection, names)
         except ExpectFailed:
-            Expect.enter(connection, "q")
+            Expect.enter(connection, CTRL_C)
+            RHUIManager.quit(connection)
             raise RuntimeError("subscription(s) not registered: %s" % names) from None
         RHUIManager.proceed_with_check(connection,
                                        "The following subscriptions will be unregistered:",
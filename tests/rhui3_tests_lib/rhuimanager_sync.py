@@ -7,28 +7,47 @@ import nose
 
 from stitches.expect import Expect, CTRL_C
 
-from rhui3_tests_lib.conmgr import ConMgr
-from rhui3_tests_lib.rhuimanager import RHUIManager
+from rhui3_tests_lib.matcher import Matcher
+from rhui3_tests_lib.pulp_tasks import PulpTaskWatcher
+from rhui3_tests_lib.rhuimanager import RHUIManager, RHUIManagerSession
 from rhui3_tests_lib.util import Util
 
-def _get_repo_status(connection, reponame):
+# the states of a repo that has finished syncing, and of one that hasn't started yet
+FINISHED_STATES = ["Success", "Error"]
+WAITING_STATES = ["Never", "Unknown"]
+
+def _get_repo_statuses(connection, repolist):
     '''
-    display repo sync summary
+    display repo sync summary, return a repo -> [next sync, last sync, status] dictionary
+    for the given repos (read from one screen)
     '''
     RHUIManager.screen(connection, "sync")
     Expect.enter(connection, "dr")
-    res = Expect.match(connection,
-                       re.compile(r".*%s\s*\r\n([^\n]*)\r\n.*" % re.escape(reponame),
-                                  re.DOTALL), [1], 60)[0]
-    connection.cli.exec_command("killall -s SIGINT rhui-manager")
-    res = Util.uncolorify(res)
-    ret_list = res.split("             ")
-    for i, _ in enumerate(ret_list):
-        ret_list[i] = ret_list[i].strip()
-
-    Expect.enter(connection, CTRL_C)
-    Expect.enter(connection, "q")
-    return ret_list
+    # wait until the rows of all the repos are on the screen
+    pattern = "".join(r"(?=.*%s\s*\r\n([^\n]*)\r\n)" % re.escape(repo) for repo in repolist)
+    rows = Matcher.match(connection,
+                         re.compile(pattern + ".*", re.DOTALL),
+                         range(1, len(repolist) + 1),
+                         60)
+    session = RHUIManagerSession.active(connection)
+    if session:
+        session.interrupt()
+    else:
+        connection.cli.exec_command("killall -s SIGINT rhui-manager")
+    statuses = {}
+    for repo, row in zip(repolist, rows):
+        statuses[repo] = [field.strip() for field in Util.uncolorify(row).split("             ")]
+
+    if not session:
+        Expect.enter(connection, CTRL_C)
+        RHUIManager.leave(connection)
+    return statuses
+
+def _get_repo_status(connection, reponame):
+    '''
+    display repo sync summary
+    '''
+    return _get_repo_statuses(connection, [reponame])[reponame]
 
 class RHUIManagerSync():
     '''
@@ -41,7 +60,7 @@ class RHUIManagerSync():
         '''
         RHUIManager.screen(connection, "sync")
         Expect.enter(connection, "sr")
-        Expect.expect(connection, "Select one or more repositories.*for more commands:", 60)
+        Matcher.expect(connection, "Select one or more repositories.*for more commands:", 60)
         Expect.enter(connection, "l")
         RHUIManager.select(connection, repolist)
         RHUIManager.proceed_with_check(connection,
@@ -53,54 +72,129 @@ class RHUIManagerSync():
     @staticmethod
     def check_sync_started(connection, repolist):
         '''ensure that sync started'''
-        for repo in repolist:
-            reposync = ["", "", "Never"]
-            while reposync[2] in ["Never", "Unknown"]:
-                time.sleep(10)
-                reposync = _get_repo_status(connection, repo)
-            if reposync[2] in ["Running", "Success"]:
-                pass
-            else:
-                raise TypeError("Something went wrong")
+        # all the repos are checked in one status read per cycle
+        pending = list(repolist)
+        while pending:
+            time.sleep(10)
+            statuses = _get_repo_statuses(connection, pending)
+            for repo in list(pending):
+                if statuses[repo][2] in WAITING_STATES:
+                    continue
+                if statuses[repo][2] not in ["Running", "Success"]:
+                    raise TypeError("Something went wrong")
+                pending.remove(repo)
 
     @staticmethod
     def wait_till_repo_synced(connection, repolist):
         '''
         wait until repo is synced
         '''
-        for repo in repolist:
-            reposync = ["", "", "Running"]
-            while reposync[2] in ["Running", "Never", "Unknown"]:
-                time.sleep(10)
-                reposync = _get_repo_status(connection, repo)
-            if reposync[2] == "Error":
-                raise TypeError("The repo sync returned Error")
-            nose.tools.assert_equal(reposync[2], "Success")
+        # all the repos are checked in one status read per cycle
+        pending = list(repolist)
+        while pending:
+            time.sleep(10)
+            statuses = _get_repo_statuses(connection, pending)
+            for repo in list(pending):
+                if statuses[repo][2] in ["Running"] + WAITING_STATES:
+                    continue
+                if statuses[repo][2] == "Error":
+                    raise TypeError("The repo sync returned Error")
+                nose.tools.assert_equal(statuses[repo][2], "Success")
+                pending.remove(repo)
 
     @staticmethod
     def wait_till_pulp_tasks_finish(connection):
         '''
         wait until there are no running Pulp tasks
         '''
-        # will be using pulp-admin, which requires you to log in to it
-        # if the Pulp user cert has expired, delete it first of all;
-        # if the Pulp user cert doesn't exist, use the one from rhui-manager
-        # but create the .pulp directory (with the right perms) if it doesn't exist
-        try:
-            if Util.cert_expired(connection, "~/.pulp/user-cert.pem"):
-                Expect.expect_retval(connection, "rm -f ~/.pulp/user-cert.pem")
-        except OSError:
+        with PulpTaskWatcher.for_rhua(connection) as watcher:
+            watcher.wait_until_idle()
+
+class RepoSyncResult():
+    '''
+    The progress of a repo sync as seen by the SyncOrchestrator.
+    '''
+    def __init__(self, repo, scheduled):
+        self.repo = repo
+        self.scheduled = scheduled
+        # when the sync was first seen running, and when it was seen finished
+        self.started = None
+        self.finished = None
+        self.state = None
+
+    def __repr__(self):
+        return "RepoSyncResult(%s, state=%s, started=%s, finished=%s)" % \
+               (self.repo, self.state, self.started, self.finished)
+
+class SyncOrchestrator():
+    '''
+    Sync a list of repos and wait for all of them with one status read per cycle.
+
+    The polling interval starts at min_interval, grows by half while nothing changes,
+    up to max_interval, and drops back when a repo starts or finishes.
+    '''
+    def __init__(self, connection, repolist, min_interval=2, max_interval=30, timeout=7200):
+        self.connection = connection
+        self.repolist = list(repolist)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.results = {}
+        self._baseline = {}
+
+    def start(self):
+        '''
+        note the current last sync times and schedule the syncs
+        '''
+        self._baseline = _get_repo_statuses(self.connection, self.repolist)
+        RHUIManagerSync.sync_repo(self.connection, self.repolist)
+        scheduled = time.time()
+        self.results = {repo: RepoSyncResult(repo, scheduled) for repo in self.repolist}
+
+    def _update(self, repo, status, now):
+        '''
+        update the result of the repo with its current status, return True if it changed
+        '''
+        result = self.results[repo]
+        changed = False
+        if not result.started and (status[2] == "Running" or
+                                   status[1] != self._baseline[repo][1]):
+            result.started = now
+            changed = True
+        # a final state is only trusted once the sync has been seen running or the last sync
+        # time has changed; until then, it can be the state of a previous sync
+        if result.started and status[2] in FINISHED_STATES:
+            result.finished = now
+            changed = True
+        result.state = status[2]
+        return changed
+
+    def wait(self):
+        '''
+        poll the repos, yield the result of each repo as soon as it has finished syncing
+        '''
+        pending = [repo for repo in self.repolist if not self.results[repo].finished]
+        interval = self.min_interval
+        deadline = time.time() + self.timeout
+        while pending:
+            if time.time() > deadline:
+                raise TimeoutError("Repos still not synced: %s" % pending)
+            time.sleep(interval)
+            statuses = _get_repo_statuses(self.connection, pending)
+            now = time.time()
+            changed = False
+            for repo in list(pending):
+                changed |= self._update(repo, statuses[repo], now)
+                if self.results[repo].finished:
+                    pending.remove(repo)
+                    yield self.results[repo]
+            interval = self.min_interval if changed else min(interval * 1.5, self.max_interval)
+
+    def run(self):
+        '''
+        schedule the syncs and wait for them, return a repo -> RepoSyncResult dictionary
+        '''
+        self.start()
+        for _ in self.wait():
             pass
-        rhua = ConMgr.get_rhua_hostname()
-        Expect.expect_retval(connection,
-                             "if ! [ -e ~/.pulp/user-cert.pem ]; then " +
-                             "mkdir -p -m 700 ~/.pulp; " +
-                             "ln -s ~/.rhui/%s/user.crt ~/.pulp/user-cert.pem; " % rhua +
-                             "touch /tmp/pulploginhack; " +
-                             "fi")
-        while connection.recv_exit_status("pulp-admin tasks list | grep -q '^No tasks found'"):
-            time.sleep(15)
-        Expect.expect_retval(connection,
-                             "if [ -f /tmp/pulploginhack ]; then " +
-                             "rm -f ~/.pulp/user-cert.pem /tmp/pulploginhack; " +
-                             "fi")
+        return self.results
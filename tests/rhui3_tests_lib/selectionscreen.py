@@ -0,0 +1,101 @@
+"""
+Selection screen module
+"""
+
+import re
+
+SELECT_ITEM_PATTERN = re.compile(r'^\s*(x|-)\s+(\d+)\s*:\s*(.*?)\s*$')
+
+class SelectionEntry():
+    """
+    one item of a multiple choice listing: the header line with the selection mark,
+    the on-screen index and the item text, plus the detail lines (if any) below it
+    """
+    def __init__(self, selected, index, text):
+        self.selected = selected
+        self.index = index
+        self.text = text
+        self.details = []
+
+    def __repr__(self):
+        return "SelectionEntry(" + \
+               "selected=%r, " % self.selected + \
+               "index=%r, " % self.index + \
+               "text=%r, " % self.text + \
+               "details=%r)" % self.details
+
+    def keys(self):
+        """
+        the strings this item can be looked up by: the text, the detail lines
+        and the values of "Key: value" detail lines
+        """
+        keys = [self.text] + self.details
+        keys += [detail.split(":", 1)[1].strip() for detail in self.details if ":" in detail]
+        return keys
+
+class SelectionScreen():
+    """
+    a multiple choice listing as rendered on a rhui-manager screen,
+    parsed once into items mapped to their full on-screen indexes
+    """
+    def __init__(self, lines):
+        self.entries = []
+        self._by_key = {}
+        # text suffixes after a space, and runs of space-separated words in the keys
+        self._by_suffix = {}
+        self._by_words = {}
+        # the results of substring searches which had to scan the entries
+        self._searched = {}
+        entry = None
+        for line in lines:
+            match = SELECT_ITEM_PATTERN.match(line)
+            if match:
+                entry = SelectionEntry(match.group(1) == "x", match.group(2), match.group(3))
+                self.entries.append(entry)
+            elif entry is not None and line.strip():
+                entry.details.append(line.strip())
+        # the same key can appear in more than one rendering of the listing; the latest one wins
+        for entry in self.entries:
+            for key in entry.keys():
+                self._by_key[key] = entry
+            words = entry.text.split(" ")
+            for start in range(1, len(words)):
+                self._by_suffix[" ".join(words[start:])] = entry
+            for key in [entry.text] + entry.details:
+                words = key.split(" ")
+                for start in range(len(words)):
+                    for end in range(start + 1, len(words) + 1):
+                        self._by_words[" ".join(words[start:end])] = entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def find(self, item):
+        """
+        return the entry whose text (or detail) is the item or ends with it, or None
+        """
+        if item in self._by_key:
+            return self._by_key[item]
+        return self._by_suffix.get(item)
+
+    def search(self, item):
+        """
+        return the entry that is or contains the item anywhere in its text or details, or None
+        """
+        entry = self.find(item) or self._by_words.get(item)
+        if entry:
+            return entry
+        # only a part of a word is given; look through the entries, but once per item
+        if item not in self._searched:
+            self._searched[item] = next((entry for entry in reversed(self.entries)
+                                         if any(item in key
+                                                for key in [entry.text] + entry.details)),
+                                        None)
+        return self._searched[item]
+
+    def selected(self, item):
+        """
+        return True if the item is on the screen and selected
+        """
+        entry = self.find(item)
+        return bool(entry and entry.selected)
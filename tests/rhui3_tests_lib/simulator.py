@@ -0,0 +1,933 @@
+"""Offline rhui-manager Simulator"""
+
+# A local stand-in for the RHUA: a fake rhui-manager (the text UI and the commands used by this
+# library) running in a pseudo-terminal, and a connection class with the interface of
+# stitches.connection.Connection that talks to it. It lets the library be exercised and
+# benchmarked on one Linux box without a network.
+#
+# Usage:
+#   python -m rhui3_tests_lib.simulator init /tmp/rhuisim --repos 200 --cds 20 --haproxies 2
+#   export RHUI_SIMULATOR=/tmp/rhuisim
+# With RHUI_SIMULATOR set, ConMgr.connect() returns SimulatedConnection objects.
+#
+# Only rhui-manager is simulated; any other command runs in a local shell, and SFTP operations
+# use local paths.
+
+import argparse
+import ctypes
+import json
+import os
+import pty
+import select
+import shutil
+import signal
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import termios
+import fcntl
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import io
+import threading
+import time
+
+SIMULATOR_ENV = "RHUI_SIMULATOR"
+STATE_FILE = "state.json"
+SEPARATOR = "-" * 78
+CONFIRM_PROMPT = "Enter value (1-%d) to toggle selection, 'c' to confirm selections, " + \
+                 "or '?' for more commands: "
+SCREENS = {"r": ("repo", "Repository Management"),
+           "c": ("cds", "Content Delivery Server (CDS) Management"),
+           "l": ("loadbalancers", "Load Balancer (HAProxy) Management"),
+           "s": ("sync", "Synchronization Status"),
+           "e": ("client", "Client Entitlement Management"),
+           "n": ("entitlements", "Entitlements Manager"),
+           "sm": ("subscriptions", "Subscriptions Manager"),
+           "u": ("users", "User Management"),
+           "i": ("identity", "RHUI Identity")}
+INSTANCE_NAMES = {"cds": "CDS", "loadbalancers": "HAProxy Load-balancer"}
+DEFAULT_SSH_KEY = "/root/.ssh/id_rsa_rhua"
+
+def _custom_repo(repo_id, name="", path="", protected=False, packages=0):
+    """a custom repo record for the state"""
+    return {"id": repo_id,
+            "name": name or repo_id,
+            "type": "Custom",
+            "kind": "Yum",
+            "version": "",
+            "path": "%s/%s" % ("protected" if protected else "unprotected", path or repo_id),
+            "entitlement": path or repo_id,
+            "gpg_check": True,
+            "redhat_gpg": True,
+            "custom_gpg": "",
+            "packages": ["%s-pkg%d-1.0-1.noarch.rpm" % (repo_id, i) for i in range(packages)],
+            "sync": None}
+
+def _redhat_repo(number, packages=0):
+    """an entitled Red Hat repo record for the state"""
+    version = "7Server-x86_64"
+    return {"id": "rhel-test-%d-rhui-rpms-%s" % (number, version),
+            "name": "Red Hat Test Product %d from RHUI (RPMs)" % number,
+            "type": "Red Hat",
+            "kind": "Yum",
+            "version": version,
+            "path": "content/dist/rhel/rhui/test/%d/7Server/x86_64/os" % number,
+            "entitlement": "content/dist/rhel/rhui/test/%d/$releasever/$basearch/os" % number,
+            "gpg_check": True,
+            "redhat_gpg": True,
+            "custom_gpg": "",
+            "packages": ["test%d-pkg%d-1.0-1.x86_64.rpm" % (number, i) for i in range(packages)],
+            "sync": None}
+
+def init_state(state_dir, repos=0, redhat_repos=10, cds=0, haproxies=0, packages=10,
+               sync_duration=0):
+    """create (or overwrite) the simulator state"""
+    if not os.path.isdir(state_dir):
+        os.makedirs(state_dir)
+    instance = lambda host: {"host_name": host,
+                             "user_name": "ec2-user",
+                             "ssh_key_path": DEFAULT_SSH_KEY}
+    state = {"repos": [_custom_repo("custom-%d" % i, packages=packages) for i in range(repos)],
+             "available": [_redhat_repo(i, packages) for i in range(redhat_repos)],
+             "cds": [instance("cds%02d.example.com" % (i + 1)) for i in range(cds)],
+             "loadbalancers": [instance("hap%02d.example.com" % (i + 1))
+                               for i in range(haproxies)],
+             "ssh_keys": [DEFAULT_SSH_KEY],
+             "sync_duration": sync_duration}
+    save_state(state_dir, state)
+    return state
+
+def load_state(state_dir):
+    """read the simulator state"""
+    with open(os.path.join(state_dir, STATE_FILE)) as state_file:
+        return json.load(state_file)
+
+def save_state(state_dir, state):
+    """write the simulator state (atomically)"""
+    path = os.path.join(state_dir, STATE_FILE)
+    with open(path + ".tmp", "w") as state_file:
+        json.dump(state, state_file)
+    os.rename(path + ".tmp", path)
+
+def _display_name(repo):
+    """the name under which a managed repo appears in the text UI"""
+    if repo["type"] == "Custom":
+        return repo["name"]
+    return "%s (%s)" % (repo["name"], repo["version"])
+
+def _available_name(repo):
+    """the name under which an entitled repo appears when it's being added"""
+    return "%s (%s)" % (_display_name(repo), repo["kind"])
+
+def _sync_status(state, repo):
+    """return (next sync, last sync, status) of the repo"""
+    if not repo["sync"]:
+        return "Unknown", "Never", "Never"
+    started = repo["sync"]
+    stamp = time.strftime("%m-%d-%Y %H:%M", time.localtime(started))
+    if time.time() - started < state["sync_duration"]:
+        return "In Progress", stamp, "Running"
+    return time.strftime("%m-%d-%Y %H:%M", time.localtime(started + 21600)), stamp, "Success"
+
+class FakeRHUIManager():
+    """the simulated rhui-manager program"""
+    def __init__(self, state_dir, stdin=sys.stdin, stdout=sys.stdout):
+        self.state_dir = state_dir
+        self.stdin = stdin
+        self.stdout = stdout
+        self.state = load_state(state_dir)
+        self.screen = "home"
+
+    def write(self, text):
+        """print text without a newline"""
+        self.stdout.write(text)
+        self.stdout.flush()
+
+    def say(self, text=""):
+        """print a line"""
+        self.write(text + "\n")
+
+    def ask(self, question):
+        """print a question and return the answer"""
+        self.write(question + " ")
+        line = self.stdin.readline()
+        if not line:
+            raise EOFError()
+        return line.strip()
+
+    def save(self):
+        """save the state"""
+        save_state(self.state_dir, self.state)
+
+    def repo_by_id(self, repo_id):
+        """return the managed repo with the ID, or None"""
+        return next((repo for repo in self.state["repos"] if repo["id"] == repo_id), None)
+
+    # text UI
+
+    def prompt(self):
+        """print the separator and the screen prompt"""
+        self.write("\n%s\nrhui (%s) => " % (SEPARATOR, self.screen))
+
+    def menu(self):
+        """print the screen header"""
+        title = "Home" if self.screen == "home" else \
+                [screen[1] for screen in SCREENS.values() if screen[0] == self.screen][0]
+        self.say(SEPARATOR)
+        self.say("             -= Red Hat Update Infrastructure Management Tool =-")
+        self.say()
+        self.say("-= %s =-" % title)
+        self.say()
+        self.say("                                        Connected: rhua.example.com")
+
+    def run_tui(self):
+        """the interactive loop"""
+        try:
+            self.menu()
+            self.prompt()
+            while True:
+                line = self.stdin.readline()
+                if not line:
+                    return
+                command = line.strip()
+                if command in ("q", "logout"):
+                    return
+                self.state = load_state(self.state_dir)
+                if command == "home":
+                    self.screen = "home"
+                    self.menu()
+                elif self.screen == "home" and command in SCREENS:
+                    self.screen = SCREENS[command][0]
+                    self.menu()
+                elif command:
+                    handler = getattr(self, "tui_%s_%s" % (self.screen, command), None)
+                    if handler:
+                        handler()
+                    else:
+                        self.say("Invalid command: %s" % command)
+                self.prompt()
+        except (KeyboardInterrupt, EOFError):
+            self.say()
+
+    def choose(self, items, prompt_text=""):
+        """multiple choice selection; return the selected indexes (from 0)"""
+        selected = set()
+        def _draw():
+            if prompt_text:
+                self.say(prompt_text)
+            for i, item in enumerate(items):
+                lines = item if isinstance(item, list) else [item]
+                self.say("  %s  %d : %s" % ("x" if i in selected else "-", i + 1, lines[0]))
+                for detail in lines[1:]:
+                    self.say(detail)
+            self.write(CONFIRM_PROMPT % len(items))
+        _draw()
+        while True:
+            line = self.stdin.readline()
+            if not line:
+                raise EOFError()
+            answer = line.strip()
+            if answer == "c":
+                return sorted(selected)
+            if answer == "a":
+                selected = set(range(len(items)))
+            elif answer.isdigit() and 0 < int(answer) <= len(items):
+                selected ^= {int(answer) - 1}
+            _draw()
+
+    def choose_one(self, items):
+        """single choice selection; return the selected index (from 0) or None"""
+        for i, item in enumerate(items):
+            self.say("  %d  - %s" % (i + 1, item))
+        answer = self.ask("Enter value (1-%d) or 'b' to abort:" % len(items))
+        if answer.isdigit() and 0 < int(answer) <= len(items):
+            return int(answer) - 1
+        return None
+
+    def confirm(self, caption, lines):
+        """print the caption and lines, return True if the user wants to proceed"""
+        self.say(caption)
+        for line in lines:
+            self.say("  " + line)
+        return self.ask("Proceed? (y/n)") == "y"
+
+    def tui_repo_l(self):
+        """list repositories"""
+        repos = self.state["repos"]
+        if not repos:
+            self.say("No repositories are currently managed by the RHUI")
+            return
+        self.say()
+        self.say("Custom Repositories")
+        for repo in sorted(repos, key=lambda r: r["name"]):
+            if repo["type"] == "Custom":
+                self.say("  " + repo["name"])
+        self.say()
+        self.say("Red Hat Repositories")
+        for kind in ("Docker", "OSTree", "Yum"):
+            kind_repos = [repo for repo in repos if repo["type"] == "Red Hat" and
+                          repo["kind"] == kind]
+            if kind_repos:
+                self.say("  " + kind)
+                for repo in sorted(kind_repos, key=lambda r: r["name"]):
+                    self.say("    " + _display_name(repo))
+
+    def tui_repo_c(self):
+        """create a custom repository"""
+        repo_id = self.ask("Unique ID for the custom repository (alphanumerics, _, and - only):")
+        while self.repo_by_id(repo_id):
+            self.say("A repository with ID \"%s\" already exists" % repo_id)
+            repo_id = self.ask("Unique ID for the custom repository " +
+                               "(alphanumerics, _, and - only):")
+        name = self.ask("Display name for the custom repository [%s]:" % repo_id) or repo_id
+        path = self.ask("Unique path at which the repository will be served [%s]:" % repo_id) \
+               or repo_id
+        self.say("Enter the checksum type to be used for the repository metadata:")
+        self.say("  1  - sha256\n  2  - sha1")
+        self.ask("Enter value (1-2) [1]:")
+        protected = self.ask("Should the repository require an entitlement certificate " +
+                             "to access? (y/n)") == "y"
+        checklist = ["ID: " + repo_id, "Name: " + name, "Path: " + path]
+        repo = _custom_repo(repo_id, name, path, protected)
+        if protected:
+            entitlement = self.ask("Path that should be used when granting an entitlement " +
+                                   "for this repository [%s]:" % path) or \
+                          path.replace("x86_64", "$basearch").replace("i386", "$basearch")
+            repo["entitlement"] = entitlement
+            checklist.append("Entitlement: " + entitlement)
+        repo["gpg_check"] = self.ask("Should the repository require clients to check that " +
+                                     "packages are signed by a GPG key? (y/n)") == "y"
+        if repo["gpg_check"]:
+            checklist.append("GPG Check Yes")
+            repo["redhat_gpg"] = self.ask("Will the repository be used to host any " +
+                                          "Red Hat GPG signed content? (y/n)") == "y"
+            checklist.append("Red Hat GPG Key: %s" % ("Yes" if repo["redhat_gpg"] else "No"))
+            keys = []
+            if self.ask("Will the repository be used to host any " +
+                        "custom GPG signed content? (y/n)") == "y":
+                while True:
+                    keys.append(self.ask("Enter the absolute path to the public key " +
+                                         "of the GPG keypair:"))
+                    if self.ask("Would you like to enter another public key? (y/n)") != "y":
+                        break
+            repo["custom_gpg"] = ", ".join(os.path.basename(key) for key in keys)
+            checklist.append("Custom GPG Keys: %s" % \
+                             (", ".join("'%s'" % key for key in keys) or "(None)"))
+        else:
+            repo["redhat_gpg"] = False
+            checklist += ["GPG Check No", "Red Hat GPG Key: No"]
+        if self.confirm("The following repository will be created:", checklist):
+            self.state["repos"].append(repo)
+            self.save()
+            self.say("Successfully created repository \"%s\"" % name)
+
+    def tui_repo_a(self):
+        """add Red Hat repositories"""
+        available = [repo for repo in self.state["available"] if not self.repo_by_id(repo["id"])]
+        self.say("Loading latest entitled products from Red Hat...")
+        self.say("Import Repositories:")
+        method = self.choose_one(["All in Certificate", "By Product", "By Repository"])
+        if method is None:
+            return
+        if method == 0:
+            chosen = available
+            if not self.confirm("The following product repositories will be deployed:",
+                                [_available_name(repo) for repo in chosen]):
+                return
+        elif method == 1:
+            products = sorted(set(repo["name"] for repo in available))
+            chosen_products = [products[i] for i in self.choose(products)]
+            if not self.confirm("The following products will be deployed:", chosen_products):
+                return
+            chosen = [repo for repo in available if repo["name"] in chosen_products]
+        else:
+            chosen = [available[i] for i in self.choose([_available_name(r) for r in available])]
+            lines = []
+            for repo in chosen:
+                lines += ["%s" % repo["name"], "  " + _available_name(repo)]
+            if not self.confirm("The following product repositories will be deployed:", lines):
+                return
+        self.state["repos"] += chosen
+        self.save()
+        for repo in chosen:
+            self.say("Importing %s..." % repo["name"])
+
+    def _choose_repos(self, repos=None):
+        """select managed repositories"""
+        repos = self.state["repos"] if repos is None else repos
+        names = [_display_name(repo) for repo in repos]
+        return [repos[i] for i in self.choose(names)]
+
+    def tui_repo_d(self):
+        """delete repositories"""
+        if not self.state["repos"]:
+            self.say("No repositories are currently managed by the RHUI")
+            return
+        chosen = self._choose_repos()
+        if self.confirm("The following repositories will be deleted:",
+                        [_display_name(repo) for repo in chosen]):
+            ids = set(repo["id"] for repo in chosen)
+            self.state["repos"] = [repo for repo in self.state["repos"] if repo["id"] not in ids]
+            self.save()
+
+    def tui_repo_u(self):
+        """upload packages from a local path"""
+        chosen = self._choose_repos([r for r in self.state["repos"] if r["type"] == "Custom"])
+        path = self.ask("Full path to a single RPM or a directory of RPMs that will be uploaded:")
+        if os.path.isdir(path):
+            rpms = sorted(name for name in os.listdir(path) if name.endswith(".rpm"))
+        else:
+            rpms = [os.path.basename(path)] if os.path.isfile(path) else []
+        if self.confirm("The following RPMs will be uploaded:", rpms):
+            for repo in chosen:
+                repo["packages"] = sorted(set(repo["packages"] + rpms))
+            self.save()
+            for rpm in rpms:
+                self.say("%s successfully uploaded" % rpm)
+
+    def tui_repo_ur(self):
+        """upload packages from a remote URL"""
+        chosen = self._choose_repos([r for r in self.state["repos"] if r["type"] == "Custom"])
+        url = self.ask("URL of the RPM or the web page with RPMs that will be uploaded:")
+        rpms = [os.path.basename(url)] if url.endswith(".rpm") else []
+        if rpms and self.confirm("The following RPMs will be uploaded:", rpms):
+            for repo in chosen:
+                repo["packages"] = sorted(set(repo["packages"] + rpms))
+            self.save()
+
+    def tui_repo_i(self):
+        """show details of repositories"""
+        for repo in self._choose_repos():
+            self.say()
+            self.say("%-21s%s" % ("Name:", repo["name"]))
+            self.say("%-21s%s" % ("Type:", repo["type"]))
+            self.say("%-21s%s" % ("Relative Path:", repo["path"]))
+            self.say("%-21s%s" % ("GPG Check:", "Yes" if repo["gpg_check"] else "No"))
+            if repo["gpg_check"]:
+                self.say("%-21s%s" % ("Custom GPG Keys:", repo["custom_gpg"] or "(None)"))
+                self.say("%-21s%s" % ("Red Hat GPG Key:", "Yes" if repo["redhat_gpg"] else "No"))
+            self.say("%-21s%s" % ("Package Count:", len(repo["packages"])))
+            if repo["type"] == "Red Hat":
+                next_sync, last_sync, _ = _sync_status(self.state, repo)
+                self.say("%-21s%s" % ("Last Sync:", last_sync))
+                self.say("%-21s%s" % ("Next Sync:", next_sync))
+            self.say()
+
+    def tui_repo_p(self):
+        """list packages in a repository"""
+        repos = self.state["repos"]
+        index = self.choose_one([_display_name(repo) for repo in repos])
+        if index is None:
+            return
+        self.say("Enter the first few characters (case insensitive) of an RPM to filter the " +
+                 "results")
+        prefix = self.ask("(blank line for no filter):").lower()
+        self.say("Only the first 100 packages are displayed, listed by file name only.")
+        packages = [p for p in repos[index]["packages"] if p.lower().startswith(prefix)]
+        if not repos[index]["packages"]:
+            self.say("No packages in the repository.")
+        elif not packages:
+            self.say("No packages found that match the given filter.")
+        else:
+            self.say("Packages:")
+            for package in packages[:100]:
+                self.say("  " + package)
+
+    def _instances_tui(self, name):
+        """name of the instance list in the state for the current screen"""
+        return self.state[self.screen], INSTANCE_NAMES[self.screen], name
+
+    def _instance_lines(self, instance):
+        """the lines describing an instance"""
+        return ["  Hostname:             %s" % instance["host_name"],
+                "  SSH Username:         %s" % instance["user_name"],
+                "  SSH Private Key:      %s" % instance["ssh_key_path"]]
+
+    def _tui_instance_l(self):
+        """list instances"""
+        instances = self.state[self.screen]
+        self.say("-= RHUI %s Instances =-" % INSTANCE_NAMES[self.screen])
+        self.say()
+        if not instances:
+            self.say("No %s instances are registered." % INSTANCE_NAMES[self.screen])
+        for instance in instances:
+            for line in self._instance_lines(instance):
+                self.say(line)
+            self.say()
+
+    def _tui_instance_a(self):
+        """add an instance"""
+        instances = self.state[self.screen]
+        kind = INSTANCE_NAMES[self.screen]
+        host = self.ask("Hostname of the %s instance to register:" % kind)
+        existing = next((i for i in instances if i["host_name"] == host), None)
+        if existing and self.ask("A %s instance with that hostname exists. " % kind +
+                                 "Continue? (y/n):") != "y":
+            return
+        user = self.ask("Username with SSH access to %s and sudo privileges:" % host)
+        key = self.ask("Absolute path to an SSH private key to log into %s as %s:" % (host, user))
+        while not (key in self.state["ssh_keys"] or os.path.isfile(key)):
+            self.say("Cannot find file, please enter a valid path.")
+            key = self.ask("Absolute path to an SSH private key to log into %s as %s:" % \
+                           (host, user))
+        self.say("Checking that instance ports are reachable...")
+        self.say("The authenticity of host '%s' can't be established." % host)
+        if self.ask("Is the fingerprint correct? (y/n):") != "y":
+            return
+        if existing:
+            instances.remove(existing)
+        instances.append({"host_name": host, "user_name": user, "ssh_key_path": key})
+        self.save()
+        self.say("The %s instance was successfully configured." % kind)
+
+    def _tui_instance_d(self):
+        """delete instances"""
+        instances = self.state[self.screen]
+        chosen = self.choose([[""] + self._instance_lines(i) for i in instances])
+        if self.ask("Are you sure you want to unregister the selected instances? (y/n):") == "y":
+            for i in chosen:
+                self.say("Unregistered %s" % instances[i]["host_name"])
+            self.state[self.screen] = [i for n, i in enumerate(instances) if n not in chosen]
+            self.save()
+
+    tui_cds_l = tui_loadbalancers_l = _tui_instance_l
+    tui_cds_a = tui_loadbalancers_a = _tui_instance_a
+    tui_cds_d = tui_loadbalancers_d = _tui_instance_d
+
+    def tui_sync_sr(self):
+        """sync repositories now"""
+        self.say("Select one or more repositories to schedule to be synchronized before its " +
+                 "scheduled time.")
+        chosen = self._choose_repos()
+        if self.confirm("The following repositories will be scheduled for synchronization:",
+                        [_display_name(repo) for repo in chosen]):
+            for repo in chosen:
+                repo["sync"] = time.time()
+            self.save()
+
+    def tui_sync_dr(self):
+        """display the sync summary until interrupted"""
+        try:
+            while True:
+                self.say("Last Refreshed: %s" % time.strftime("%H:%M:%S"))
+                self.say("(updated every 5 seconds, ctrl+c to exit)")
+                self.say()
+                self.say("Next Sync                    Last Sync                    Status")
+                self.say(SEPARATOR)
+                for repo in self.state["repos"]:
+                    self.say(_display_name(repo))
+                    self.say("  " + "             ".join(_sync_status(self.state, repo)))
+                    self.say()
+                time.sleep(5)
+                self.state = load_state(self.state_dir)
+        except KeyboardInterrupt:
+            pass
+
+    # command line interface
+
+    def run_cli(self, argv):
+        """run a non-interactive command, return the exit status"""
+        parser = argparse.ArgumentParser(prog="rhui-manager")
+        parser.add_argument("command", nargs="*")
+        for option in ("repo_id", "repo_ids", "path", "display_name", "entitlement",
+                       "gpg_public_keys", "delimiter", "product_name"):
+            parser.add_argument("--" + option, default="")
+        for flag in ("ids_only", "redhat_only", "legacy_md", "redhat_content", "protected"):
+            parser.add_argument("--" + flag, action="store_true")
+        args, _ = parser.parse_known_args(argv)
+        handler = getattr(self, "cli_" + "_".join(args.command), None)
+        if not handler:
+            self.say("Usage: rhui-manager [options] command")
+            return 1
+        return handler(args) or 0
+
+    def cli_status(self, _):
+        """rhui-manager status"""
+        self.say("-= RHUI Status =-")
+        self.say("Entitlement CA certificate expiration date ... OK")
+        for repo in self.state["repos"]:
+            self.say("%-60s %s" % (_display_name(repo), _sync_status(self.state, repo)[2]))
+
+    def cli_repo_list(self, args):
+        """rhui-manager repo list"""
+        repos = sorted(self.state["repos"], key=lambda repo: repo["id"])
+        if args.redhat_only:
+            repos = [repo for repo in repos if repo["type"] == "Red Hat"]
+        if args.ids_only:
+            self.write((args.delimiter or "\n").join(repo["id"] for repo in repos) + "\n")
+            return
+        for repo in repos:
+            self.say("%s :: %s" % (repo["id"], repo["name"]))
+
+    def cli_repo_info(self, args):
+        """rhui-manager repo info"""
+        repo = self.repo_by_id(args.repo_id)
+        if not repo:
+            self.say("repository %s was not found" % args.repo_id)
+            return 1
+        self.say("Name:                %s" % repo["name"])
+        self.say("ID:                  %s" % repo["id"])
+        self.say("Type:                %s" % repo["type"])
+        self.say("Relative Path:       %s" % repo["path"])
+        self.say("GPG Check:           %s" % ("Yes" if repo["gpg_check"] else "No"))
+        self.say("Package Count:       %s" % len(repo["packages"]))
+        return 0
+
+    def cli_repo_create_custom(self, args):
+        """rhui-manager repo create_custom"""
+        if not args.repo_id:
+            self.say("Usage: rhui-manager repo create_custom --repo_id <id>")
+            return 1
+        if self.repo_by_id(args.repo_id):
+            self.say("A repository with ID \"%s\" already exists" % args.repo_id)
+            return 1
+        keys = [key for key in args.gpg_public_keys.split(",") if key]
+        bad_keys = [key for key in keys if not os.path.isfile(key)]
+        if bad_keys:
+            self.say("The following files are unreadable:\n\n%s" % "\n".join(bad_keys))
+            return 1
+        repo = _custom_repo(args.repo_id, args.display_name, args.path, args.protected)
+        repo["custom_gpg"] = ", ".join(os.path.basename(key) for key in keys)
+        self.state["repos"].append(repo)
+        self.save()
+        self.say("Successfully created repository \"%s\"" % (args.display_name or args.repo_id))
+        return 0
+
+    def cli_repo_delete(self, args):
+        """rhui-manager repo delete"""
+        repo = self.repo_by_id(args.repo_id)
+        if not repo:
+            self.say("repository %s was not found" % args.repo_id)
+            return 1
+        self.state["repos"].remove(repo)
+        self.save()
+        return 0
+
+    def cli_repo_add_by_repo(self, args):
+        """rhui-manager repo add_by_repo"""
+        for repo_id in args.repo_ids.split(","):
+            repo = next((r for r in self.state["available"] if r["id"] == repo_id), None)
+            if repo and not self.repo_by_id(repo_id):
+                self.state["repos"].append(repo)
+                self.say("Successfully added %s" % _display_name(repo))
+        self.save()
+        return 0
+
+    def cli_repo_sync(self, args):
+        """rhui-manager repo sync"""
+        repo = self.repo_by_id(args.repo_id)
+        if not repo:
+            self.say("repository %s was not found" % args.repo_id)
+            return 1
+        repo["sync"] = time.time()
+        self.save()
+        self.say("The repository %s has been successfully scheduled for the next available " \
+                 "timeslot" % args.repo_id)
+        return 0
+
+    def cli_packages_list(self, args):
+        """rhui-manager packages list"""
+        repo = self.repo_by_id(args.repo_id)
+        for package in repo["packages"] if repo else []:
+            self.say(package)
+        return 0
+
+    def cli_client_labels(self, _):
+        """rhui-manager client labels"""
+        for repo in self.state["repos"]:
+            self.say(repo["id"] if repo["type"] == "Red Hat" else "custom-" + repo["id"])
+        return 0
+
+class _PulpHandler(BaseHTTPRequestHandler):
+    """the Pulp task API calls used by PulpTaskWatcher, with a task for each repo sync"""
+    def _tasks(self):
+        """return the tasks (running or finished syncs)"""
+        state = load_state(self.server.state_dir)
+        tasks = []
+        for repo in state["repos"]:
+            if repo["sync"]:
+                running = _sync_status(state, repo)[2] == "Running"
+                tasks.append({"task_id": "sync-" + repo["id"],
+                              "state": "running" if running else "finished",
+                              "progress_report": {}})
+        return tasks
+
+    def _reply(self, code, data):
+        """send a JSON response"""
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """return a task"""
+        task_id = self.path.rstrip("/").split("/")[-1]
+        task = next((task for task in self._tasks() if task["task_id"] == task_id), None)
+        if task:
+            self._reply(200, task)
+        else:
+            self._reply(404, {"error_message": "Missing resource(s): task_id=%s" % task_id})
+
+    def do_POST(self):
+        """search tasks (by state only)"""
+        length = int(self.headers.get("Content-Length", 0))
+        criteria = json.loads(self.rfile.read(length).decode() or "{}").get("criteria", {})
+        states = criteria.get("filters", {}).get("state", {}).get("$in")
+        self._reply(200, [task for task in self._tasks() if not states or task["state"] in states])
+
+    def log_message(self, *args):
+        """be quiet"""
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """an HTTP server handling each request in a thread (http.server has one as of Python 3.7)"""
+    daemon_threads = True
+
+def start_pulp_server(state_dir="", port=0):
+    """
+    serve the Pulp task API in a background thread, return the server and the API URL
+    (to be put in RHUI_PULP_URL)
+    """
+    server = _ThreadingHTTPServer(("127.0.0.1", port), _PulpHandler)
+    server.state_dir = os.path.abspath(state_dir or os.environ[SIMULATOR_ENV])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, "http://127.0.0.1:%d/pulp/api/v2/" % server.server_address[1]
+
+class _PtyChannel():
+    """an interactive shell in a pseudo-terminal, with the paramiko Channel methods we need"""
+    def __init__(self, env):
+        self.pid, self.fd = pty.fork()
+        if self.pid == 0:
+            os.execvpe("bash", ["bash", "--norc", "--noprofile", "-i"], env)
+        fcntl.ioctl(self.fd, termios.TIOCSWINSZ, struct.pack("HHHH", 80, 360, 0, 0))
+        self.timeout = 0.1
+
+    def settimeout(self, timeout):
+        """set the time to wait for output in recv()"""
+        self.timeout = timeout
+
+    def recv(self, size):
+        """return output, raise socket.timeout if there's none"""
+        ready, _, _ = select.select([self.fd], [], [], self.timeout)
+        if not ready:
+            raise socket.timeout()
+        try:
+            return os.read(self.fd, size)
+        except OSError:
+            # the shell has exited
+            return b""
+
+    def send(self, data):
+        """write input"""
+        return os.write(self.fd, data.encode())
+
+    def close(self):
+        """terminate the shell"""
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+            os.waitpid(self.pid, 0)
+        except OSError:
+            pass
+        os.close(self.fd)
+
+class _CommandStatus():
+    """the exit status part of paramiko's channel, for a local process"""
+    def __init__(self, process):
+        self.process = process
+
+    def exit_status_ready(self):
+        """has the process finished?"""
+        return self.process.poll() is not None
+
+    def recv_exit_status(self):
+        """wait for the process, return its exit status"""
+        return self.process.wait()
+
+class _CommandFile():
+    """a paramiko ChannelFile lookalike: read() returns bytes, lines are text"""
+    def __init__(self, stream, process):
+        self.stream = stream
+        self.channel = _CommandStatus(process)
+
+    def read(self, size=-1):
+        """read bytes"""
+        return self.stream.read(size)
+
+    def readline(self):
+        """read a line of text"""
+        return self.stream.readline().decode()
+
+    def __iter__(self):
+        return iter(self.readline, "")
+
+    def write(self, data):
+        """write text or bytes"""
+        self.stream.write(data.encode() if isinstance(data, str) else data)
+
+    def close(self):
+        """close the stream"""
+        self.stream.close()
+
+class _LocalFile(io.FileIO):
+    """a local file with the paramiko SFTPFile tuning methods (which do nothing here)"""
+    def prefetch(self, file_size=None):
+        """nothing to prefetch"""
+
+    def set_pipelined(self, pipelined=True):
+        """nothing to pipeline"""
+
+class _LocalSFTP():
+    """the paramiko SFTPClient methods we need, on local paths"""
+    @staticmethod
+    def get(remotepath, localpath):
+        """copy a file"""
+        shutil.copyfile(remotepath, localpath)
+
+    @staticmethod
+    def put(localpath, remotepath):
+        """copy a file"""
+        shutil.copyfile(localpath, remotepath)
+
+    @staticmethod
+    def open(filename, mode="r", bufsize=-1):
+        """open a file (always in binary mode, like SFTP)"""
+        return _LocalFile(filename, mode.replace("b", "").replace("+", "") or "r")
+
+    @staticmethod
+    def stat(path):
+        """stat a file"""
+        return os.stat(path)
+
+    @staticmethod
+    def remove(path):
+        """delete a file"""
+        os.remove(path)
+
+    def close(self):
+        """nothing to close"""
+
+class SimulatedConnection():
+    """a stitches Connection lookalike for a host backed by the simulator"""
+    def __init__(self, hostname, username="root", state_dir=""):
+        self.hostname = self.private_hostname = self.public_hostname = hostname
+        self.username = username
+        self.state_dir = os.path.abspath(state_dir or os.environ[SIMULATOR_ENV])
+        self.output_shell = False
+        self.last_command = ""
+        self.last_stdout = ""
+        self.last_stderr = ""
+        self.sftp = _LocalSFTP()
+        self._channel = None
+        bin_dir = os.path.join(self.state_dir, "bin")
+        wrapper = os.path.join(bin_dir, "rhui-manager")
+        # a Python script like the real one, so it can also be run in-process
+        script = "#!%s\nimport sys\nfrom rhui3_tests_lib.simulator import main\n" \
+                 "sys.exit(main([\"rhui-manager\"] + sys.argv[1:]))\n" % sys.executable
+        if not os.path.isdir(bin_dir):
+            os.makedirs(bin_dir)
+        if not os.path.exists(wrapper) or open(wrapper).read() != script:
+            with open(wrapper, "w") as wrapper_file:
+                wrapper_file.write(script)
+            os.chmod(wrapper, 0o755)
+        library_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.env = dict(os.environ,
+                        PATH=bin_dir + os.pathsep + os.environ.get("PATH", ""),
+                        PYTHONPATH=library_dir + os.pathsep + os.environ.get("PYTHONPATH", ""),
+                        PS1="[%s@%s ~]# " % (username, hostname.split(".")[0]),
+                        TERM="dumb")
+        self.env[SIMULATOR_ENV] = self.state_dir
+
+    @property
+    def channel(self):
+        """the interactive shell, started when first needed"""
+        if not self._channel:
+            self._channel = _PtyChannel(self.env)
+            output = ""
+            while "%s@" % self.username not in output:
+                try:
+                    output += self._channel.recv(16384).decode(errors="replace")
+                except socket.timeout:
+                    pass
+        return self._channel
+
+    @property
+    def cli(self):
+        """the SSH client; exec_command() is all that's used of it"""
+        return self
+
+    def exec_command(self, command, bufsize=-1, get_pty=False):
+        """run a command, return its stdin, stdout and stderr"""
+        # bufsize and get_pty are accepted for compatibility only
+        self.last_command = command
+        process = subprocess.Popen(["bash", "-c", command],
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   env=self.env)
+        return _CommandFile(process.stdin, process), \
+               _CommandFile(process.stdout, process), \
+               _CommandFile(process.stderr, process)
+
+    def recv_exit_status(self, command, timeout=10, get_pty=False):
+        """run a command and return its exit status, or None if it times out"""
+        self.last_command = command
+        process = subprocess.Popen(["bash", "-c", command],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   env=self.env)
+        try:
+            self.last_stdout, self.last_stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            return None
+        return process.returncode
+
+    def disconnect(self):
+        """stop the interactive shell"""
+        if self._channel:
+            self._channel.close()
+            self._channel = None
+
+    reconnect = disconnect
+
+def _set_process_name(name):
+    """make the process show up (and be killable) under the given name"""
+    try:
+        ctypes.CDLL(None).prctl(15, name.encode(), 0, 0, 0)
+    except (OSError, AttributeError):
+        pass
+
+def main(argv=None):
+    """command line entry point"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "rhui-manager":
+        _set_process_name("rhui-manager")
+        fake = FakeRHUIManager(os.environ[SIMULATOR_ENV], sys.stdin, sys.stdout)
+        if len(argv) == 1:
+            fake.run_tui()
+            return 0
+        return fake.run_cli(argv[1:])
+    parser = argparse.ArgumentParser(description="Set up the offline rhui-manager simulator.")
+    parser.add_argument("action", choices=["init"])
+    parser.add_argument("state_dir")
+    parser.add_argument("--repos", type=int, default=0, help="custom repos to create")
+    parser.add_argument("--redhat-repos", type=int, default=10, help="entitled Red Hat repos")
+    parser.add_argument("--cds", type=int, default=0, help="registered CDS nodes")
+    parser.add_argument("--haproxies", type=int, default=0, help="registered HAProxy nodes")
+    parser.add_argument("--packages", type=int, default=10, help="packages per repo")
+    parser.add_argument("--sync-duration", type=int, default=0, help="seconds a sync takes")
+    args = parser.parse_args(argv)
+    init_state(args.state_dir, args.repos, args.redhat_repos, args.cds, args.haproxies,
+               args.packages, args.sync_duration)
+    print("Simulator state created. Now run: export %s=%s" % (SIMULATOR_ENV,
+                                                              os.path.abspath(args.state_dir)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
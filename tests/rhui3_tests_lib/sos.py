@@ -1,10 +1,18 @@
 """Sos in RHUI"""
 
 import re
+import tarfile
 
 import nose
 from stitches.expect import Expect
 
+from rhui3_tests_lib.conmgr import ConMgr
+
+# the archive contains files like:
+# sosreport-HOST-DATE-HASH/sos_commands/rhui/rhui-debug-DATE-TIME/etc/pulp/repo_auth.conf
+# while file lists contain actual paths like /etc/pulp/repo_auth.conf
+ARCHIVE_PREFIX_PATTERN = re.compile("^.*/rhui-debug[^/]+")
+
 class Sos():
     """Sos handling for RHUI"""
     @staticmethod
@@ -24,20 +32,43 @@ class Sos():
         location = stdout.read().decode().strip()
         return location
 
+    @staticmethod
+    def run_on_all(hostnames=None):
+        """
+        run the sosreport command on the hosts (the RHUA and all CDS nodes by default)
+        in parallel, return a hostname -> tarball location dictionary
+        """
+        if hostnames is None:
+            hostnames = [ConMgr.get_rhua_hostname()] + ConMgr.get_cds_hostnames()
+        locations = {}
+        for host_result in ConMgr.fan_out(hostnames, Sos.run):
+            if host_result.error:
+                raise host_result.error
+            locations[host_result.hostname] = host_result.result
+        return locations
+
+    @staticmethod
+    def archive_members(connection, archive):
+        """
+        return the set of the paths collected in the given archive (directories end with /),
+        read as a stream over SFTP
+        """
+        try:
+            remote_file = connection.sftp.open(archive, "rb")
+        except IOError:
+            raise OSError("%s does not exist" % archive) from None
+        try:
+            remote_file.prefetch()
+            with tarfile.open(fileobj=remote_file, mode="r|*") as tar:
+                return {ARCHIVE_PREFIX_PATTERN.sub("", member.name) + \
+                        ("/" if member.isdir() else "") for member in tar}
+        finally:
+            remote_file.close()
+
     @staticmethod
     def check_files_in_archive(connection, filelist, archive):
         """check if the files in the given filelist are collected in the given archive"""
-        # make sure the archive exists
-        if connection.recv_exit_status("test -f %s" % archive):
-            raise OSError("%s does not exist" % archive)
-        # read the contents of the archive, and check if each file from the filelist is there
-        # must strip the path in front of the real root directory; the archive contains files like:
-        # sosreport-HOST-DATE-HASH/sos_commands/rhui/rhui-debug-DATE-TIME/etc/pulp/repo_auth.conf
-        # while the given filelist contains actual paths like /etc/pulp/repo_auth.conf
-        pattern = "^.*/rhui-debug[^/]+"
-        _, stdout, _ = connection.exec_command("tar tf %s" % archive)
-        archive_filelist_raw = stdout.read().decode().splitlines()
-        archive_filelist = [re.sub(pattern, "", path) for path in archive_filelist_raw]
+        archive_filelist = Sos.archive_members(connection, archive)
         missing_files = [f for f in filelist if f not in archive_filelist]
         nose.tools.ok_(not missing_files,
                        msg="Not found in the archive: %s" % missing_files)
@@ -0,0 +1,542 @@
+"""Recording and Replaying Connection Transcripts"""
+
+# A transcript is a gzipped JSON-lines file: a header with the host name and the start time,
+# followed by one [seconds since the start, kind, data...] list per event:
+#   "s": data sent to the shell channel (Expect.enter payloads)
+#   "r": a chunk of output received from the shell channel
+#   "x": a command run by recv_exit_status, with its exit status, stdout and stderr
+#   "e": a command run by exec_command (or cli.exec_command), with its number in the transcript
+#   "i": input written to a command, with its number
+#   "o": output read from a command, with its number, "stdout" or "stderr", and the data
+#   "z": the exit status of a command, with its number
+#   "f": an SFTP operation: "open" with the path, the mode and the data read or written,
+#        "get"/"put" with the remote path, an empty mode and the contents of the file, or
+#        "remove" with the path, an empty mode and no data
+# The input, output and exit status of a command run by exec_command are recorded as the code
+# writes, reads and asks for them, in whatever order it does, so the code reads the output while
+# the command runs just like without a transcript; output that isn't read isn't recorded.
+# The replay serves them by the command number. A file opened over SFTP is recorded when it's
+# closed, so "f" events are matched by the path rather than by the position on replay.
+#
+# With RHUI_TRANSCRIPT_DIR set, ConMgr.connect() returns RecordingConnection objects which
+# write a transcript per connection to that directory; disconnect() finishes the transcript, and
+# a new one is started if the connection is used again. ReplayConnection objects feed
+# a transcript back to the library (at full speed by default) and check that it sends
+# the same input.
+
+import atexit
+import gzip
+import io
+import json
+import os
+import socket
+import threading
+import time
+
+TRANSCRIPT_ENV = "RHUI_TRANSCRIPT_DIR"
+ENCODING = "utf-8"
+ERRORS = "surrogateescape"
+
+class TranscriptMismatch(Exception):
+    """
+    Raised when the replayed code sends or runs something else than what was recorded
+    """
+
+def transcript_path(directory, hostname):
+    """return a unique transcript file name for the host in the directory"""
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(directory, "%s-%s.jsonl.gz" % (hostname, stamp))
+    number = 1
+    while os.path.exists(path):
+        number += 1
+        path = os.path.join(directory, "%s-%s-%d.jsonl.gz" % (hostname, stamp, number))
+    return path
+
+def _text(data):
+    """convert received bytes to text that can be stored in JSON"""
+    if isinstance(data, bytes):
+        return data.decode(ENCODING, ERRORS)
+    return data
+
+class _TranscriptWriter():
+    """an open transcript file"""
+    def __init__(self, path, hostname):
+        self.file = gzip.open(path, "wt")
+        self.start = time.time()
+        # the number of commands run by exec_command
+        self.commands = 0
+        # the output of a command can be read in another thread
+        self.lock = threading.Lock()
+        self.write({"host": hostname, "started": self.start})
+        atexit.register(self.close)
+
+    def write(self, item):
+        """write a line"""
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(json.dumps(item, separators=(",", ":")) + "\n")
+
+    def event(self, kind, *data):
+        """write an event"""
+        self.write([round(time.time() - self.start, 3), kind] + list(data))
+
+    def command(self, command):
+        """write the start of an exec_command command, return its number"""
+        with self.lock:
+            self.commands += 1
+            number = self.commands
+        self.event("e", command, number)
+        return number
+
+    def flush(self):
+        """flush the file"""
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+
+    def close(self):
+        """close the file"""
+        with self.lock:
+            self.file.close()
+        atexit.unregister(self.close)
+
+class _CommandStatus():
+    """the exit status part of paramiko's channel, for a finished command"""
+    def __init__(self, status):
+        self.status = status
+
+    @staticmethod
+    def exit_status_ready():
+        """the command has finished"""
+        return True
+
+    def recv_exit_status(self):
+        """return the exit status"""
+        return self.status
+
+class _CommandFile():
+    """a paramiko ChannelFile lookalike with captured output: read() returns bytes, lines text"""
+    def __init__(self, data, status):
+        self.buffer = io.BytesIO(data)
+        self.channel = _CommandStatus(status)
+
+    def read(self, size=-1):
+        """read bytes"""
+        return self.buffer.read(size)
+
+    def readline(self):
+        """read a line of text"""
+        return self.buffer.readline().decode(ENCODING, ERRORS)
+
+    def readlines(self):
+        """read all lines"""
+        return list(self)
+
+    def __iter__(self):
+        return iter(self.readline, "")
+
+    def write(self, _):
+        """discard input"""
+
+    def close(self):
+        """nothing to close"""
+
+class _RecordingCommandChannel():
+    """the channel of a command run by exec_command; the exit status is recorded when asked for"""
+    def __init__(self, channel, writer, number):
+        self._channel = channel
+        self._writer = writer
+        self._number = number
+        self._status_recorded = False
+
+    def recv_exit_status(self):
+        """wait for the command to finish, record and return its exit status"""
+        status = self._channel.recv_exit_status()
+        if not self._status_recorded:
+            self._status_recorded = True
+            self._writer.event("z", self._number, status)
+        return status
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
+
+class _RecordingStream():
+    """the stdin, stdout or stderr of a command run by exec_command, recorded as it's used"""
+    def __init__(self, stream, channel, name):
+        self._stream = stream
+        self.channel = channel
+        self._name = name
+
+    def _record(self, data):
+        """record data read from the stream, return it"""
+        if data:
+            self.channel._writer.event("o", self.channel._number, self._name, _text(data))
+        return data
+
+    def read(self, *args):
+        """read output"""
+        return self._record(self._stream.read(*args))
+
+    def readline(self, *args):
+        """read a line of output"""
+        return self._record(self._stream.readline(*args))
+
+    def readlines(self):
+        """read all lines"""
+        return list(self)
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+    def write(self, data):
+        """write input"""
+        self.channel._writer.event("i", self.channel._number, _text(data))
+        return self._stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+class _RecordingChannel():
+    """a channel which records what goes through it"""
+    def __init__(self, channel, recording):
+        self._channel = channel
+        self._recording = recording
+
+    def send(self, data):
+        """send data and record it"""
+        self._recording.writer.event("s", data)
+        return self._channel.send(data)
+
+    def recv(self, size):
+        """receive data and record it"""
+        data = self._channel.recv(size)
+        if data:
+            self._recording.writer.event("r", _text(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
+
+class _RecordingFile():
+    """a file opened over SFTP, recorded with the data read or written when it's closed"""
+    def __init__(self, remote_file, recording, path, mode):
+        self._file = remote_file
+        self._recording = recording
+        self._path = path
+        self._mode = mode
+        self._data = []
+        self._closed = False
+
+    def read(self, *args):
+        """read data and keep it for the transcript"""
+        data = self._file.read(*args)
+        self._data.append(data)
+        return data
+
+    def write(self, data):
+        """write data and keep it for the transcript"""
+        self._data.append(data.encode(ENCODING) if isinstance(data, str) else data)
+        return self._file.write(data)
+
+    def close(self):
+        """close the file and record it"""
+        if not self._closed:
+            self._closed = True
+            self._file.close()
+            self._recording.writer.event("f", "open", self._path, self._mode,
+                                         _text(b"".join(self._data)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+class _RecordingSFTP():
+    """an SFTP client which records the files opened, fetched and sent"""
+    def __init__(self, sftp, recording):
+        self._sftp = sftp
+        self._recording = recording
+
+    def open(self, filename, mode="r", bufsize=-1):
+        """open a remote file"""
+        return _RecordingFile(self._sftp.open(filename, mode, bufsize), self._recording,
+                              filename, mode)
+
+    def get(self, remotepath, localpath, *args):
+        """fetch a remote file and record its contents"""
+        result = self._sftp.get(remotepath, localpath, *args)
+        with open(localpath, "rb") as local_file:
+            self._recording.writer.event("f", "get", remotepath, "", _text(local_file.read()))
+        return result
+
+    def put(self, localpath, remotepath, *args):
+        """send a local file and record its contents"""
+        result = self._sftp.put(localpath, remotepath, *args)
+        with open(localpath, "rb") as local_file:
+            self._recording.writer.event("f", "put", remotepath, "", _text(local_file.read()))
+        return result
+
+    def remove(self, path):
+        """remove a remote file and record it"""
+        self._sftp.remove(path)
+        self._recording.writer.event("f", "remove", path, "", "")
+
+    def __getattr__(self, name):
+        return getattr(self._sftp, name)
+
+class RecordingConnection():
+    """a connection which records its shell channel traffic, commands and files to a transcript"""
+    def __init__(self, connection, path):
+        self.connection = connection
+        self.path = path
+        self._writer = _TranscriptWriter(path, getattr(connection, "hostname", ""))
+        self._channel = None
+        self._sftp = None
+
+    @property
+    def writer(self):
+        """the transcript; a new one is started if the connection is used after disconnect()"""
+        if self._writer.file.closed:
+            hostname = getattr(self.connection, "hostname", "")
+            self.path = transcript_path(os.path.dirname(self.path), hostname)
+            self._writer = _TranscriptWriter(self.path, hostname)
+        return self._writer
+
+    @property
+    def channel(self):
+        """the recording shell channel"""
+        if not self._channel or self._channel._channel is not self.connection.channel:
+            self._channel = _RecordingChannel(self.connection.channel, self)
+        return self._channel
+
+    @property
+    def cli(self):
+        """the SSH client; its exec_command() is recorded like that of the connection"""
+        return self
+
+    @property
+    def sftp(self):
+        """the recording SFTP client"""
+        if not self._sftp or self._sftp._sftp is not self.connection.sftp:
+            self._sftp = _RecordingSFTP(self.connection.sftp, self)
+        return self._sftp
+
+    def recv_exit_status(self, command, timeout=10, get_pty=False):
+        """run a command and record it with its result"""
+        retval = self.connection.recv_exit_status(command, timeout, get_pty)
+        self.writer.event("x", command, retval, _text(self.connection.last_stdout),
+                          _text(self.connection.last_stderr))
+        return retval
+
+    def exec_command(self, command, bufsize=-1, get_pty=False):
+        """run a command, return its stdin, stdout and stderr, which record what they pass"""
+        writer = self.writer
+        number = writer.command(command)
+        stdin, stdout, stderr = self.connection.exec_command(command, bufsize, get_pty)
+        channel = _RecordingCommandChannel(stdout.channel, writer, number)
+        return _RecordingStream(stdin, channel, "stdin"), \
+               _RecordingStream(stdout, channel, "stdout"), \
+               _RecordingStream(stderr, channel, "stderr")
+
+    def disconnect(self):
+        """disconnect and finish the transcript"""
+        self._writer.close()
+        self.connection.disconnect()
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+def read_transcript(path):
+    """return the header and the list of events of a transcript"""
+    with gzip.open(path, "rt") as transcript:
+        header = json.loads(transcript.readline())
+        return header, [json.loads(line) for line in transcript]
+
+class _ReplayChannel():
+    """a channel which returns the recorded output"""
+    def __init__(self, replay):
+        self._replay = replay
+
+    def settimeout(self, _):
+        """nothing to do"""
+
+    def send(self, data):
+        """check that the data is what was sent in the recording"""
+        self._replay.take("s", data)
+        return len(data)
+
+    def recv(self, _):
+        """return the next recorded output, raise socket.timeout if input comes next"""
+        event = self._replay.peek()
+        if not event or event[1] != "r":
+            raise socket.timeout()
+        self._replay.take("r")
+        return event[2].encode(ENCODING, ERRORS)
+
+class _ReplayFile():
+    """a file opened over SFTP with the recorded contents; what's written is checked on close"""
+    def __init__(self, replay, path, mode, data):
+        self._replay = replay
+        self._path = path
+        self._writing = "w" in mode or "a" in mode
+        self._recorded = data
+        self._buffer = io.BytesIO(b"" if self._writing else data)
+
+    def read(self, size=None):
+        """read the recorded data"""
+        return self._buffer.read(-1 if size is None else size)
+
+    def write(self, data):
+        """collect the data to be checked"""
+        self._buffer.write(data.encode(ENCODING) if isinstance(data, str) else data)
+
+    def prefetch(self, *_):
+        """nothing to do"""
+
+    def set_pipelined(self, *_):
+        """nothing to do"""
+
+    def close(self):
+        """check that the data written is what was written in the recording"""
+        if self._writing and self._buffer.getvalue() != self._recorded:
+            raise TranscriptMismatch("Other data written to %s than in the recording" % \
+                                     self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+class _ReplaySFTP():
+    """an SFTP client which serves and checks the recorded files"""
+    def __init__(self, replay):
+        self._replay = replay
+
+    def open(self, filename, mode="r", bufsize=-1):
+        """open a recorded file"""
+        event = self._replay.take_file("open", filename, mode)
+        return _ReplayFile(self._replay, filename, mode, event[5].encode(ENCODING, ERRORS))
+
+    def get(self, remotepath, localpath, *_):
+        """write the recorded contents of the remote file to the local path"""
+        event = self._replay.take_file("get", remotepath)
+        with open(localpath, "wb") as local_file:
+            local_file.write(event[5].encode(ENCODING, ERRORS))
+
+    def put(self, localpath, remotepath, *_):
+        """check that the local file is what was sent in the recording"""
+        event = self._replay.take_file("put", remotepath)
+        with open(localpath, "rb") as local_file:
+            if local_file.read() != event[5].encode(ENCODING, ERRORS):
+                raise TranscriptMismatch("Other data sent to %s than in the recording" % \
+                                         remotepath)
+
+    def remove(self, path):
+        """check that the file was removed in the recording"""
+        self._replay.take_file("remove", path)
+
+    def close(self):
+        """nothing to close"""
+
+class ReplayConnection():
+    """
+    a connection which replays a transcript;
+    with real_time=True, output is returned no sooner than it was received in the recording
+    """
+    def __init__(self, path, real_time=False):
+        self.header, self.events = read_transcript(path)
+        self.hostname = self.header["host"]
+        self.real_time = real_time
+        self.output_shell = False
+        self.last_command = ""
+        self.last_stdout = ""
+        self.last_stderr = ""
+        self.channel = _ReplayChannel(self)
+        self.sftp = _ReplaySFTP(self)
+        self.position = 0
+        # the positions of file events replayed ahead of the current position
+        self.taken = set()
+        self.start = time.time()
+
+    @property
+    def cli(self):
+        """the SSH client; exec_command() is all that's used of it"""
+        return self
+
+    def peek(self):
+        """return the next event, or None at the end of the transcript"""
+        while self.position in self.taken:
+            self.taken.discard(self.position)
+            self.position += 1
+        if self.position < len(self.events):
+            return self.events[self.position]
+        return None
+
+    def take(self, kind, data=None):
+        """
+        consume the next event, which must be of the given kind
+        (and have the given data, if specified); return the event
+        """
+        event = self.peek()
+        if not event or event[1] != kind or (data is not None and event[2] != data):
+            raise TranscriptMismatch("Expected %s at event %d, got %s" % \
+                                     ([kind, data], self.position, event))
+        if self.real_time:
+            delay = self.start + event[0] - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        self.position += 1
+        return event
+
+    def take_file(self, operation, path, mode=""):
+        """consume the next file event for the operation, path and mode; return the event"""
+        self.peek()
+        for position in range(self.position, len(self.events)):
+            event = self.events[position]
+            if position not in self.taken and event[1:5] == ["f", operation, path, mode]:
+                self.taken.add(position)
+                return event
+        raise TranscriptMismatch("No recorded %s of %s (mode %r) after event %d" % \
+                                 (operation, path, mode, self.position))
+
+    def exec_command(self, command, bufsize=-1, get_pty=False):
+        """return the recorded stdin (discarding input), stdout and stderr of the command"""
+        number = self.take("e", command)[3]
+        self.last_command = command
+        output = {"stdout": [], "stderr": []}
+        status = None
+        # the command's events are taken ahead of the current position
+        for position in range(self.position, len(self.events)):
+            event = self.events[position]
+            if event[1] in ("i", "o", "z") and event[2] == number:
+                self.taken.add(position)
+                if event[1] == "o":
+                    output[event[3]].append(event[4])
+                elif event[1] == "z":
+                    status = event[3]
+        return _CommandFile(b"", status), \
+               _CommandFile("".join(output["stdout"]).encode(ENCODING, ERRORS), status), \
+               _CommandFile("".join(output["stderr"]).encode(ENCODING, ERRORS), status)
+
+    def recv_exit_status(self, command, timeout=10, get_pty=False):
+        """return the recorded result of the command"""
+        event = self.take("x", command)
+        self.last_command = command
+        self.last_stdout = event[4].encode(ENCODING, ERRORS)
+        self.last_stderr = event[5].encode(ENCODING, ERRORS)
+        return event[3]
+
+    def finished(self):
+        """has the whole transcript been replayed?"""
+        return self.peek() is None
+
+    def disconnect(self):
+        """nothing to do"""
@@ -0,0 +1,100 @@
+"""Indexed Errata Information"""
+
+import re
+
+from rhui3_tests_lib import repodata
+from rhui3_tests_lib.repomd_cache import repomd_cache
+
+ADVISORY_PATTERN = re.compile("^RH[BES]A-[0-9]+:[0-9]+$")
+
+class Updateinfo():
+    """advisories from an updateinfo.xml file, indexed by ID, package, severity and type"""
+    def __init__(self, advisories=()):
+        # advisory ID -> Advisory record
+        self.advisories = {}
+        # package NEVRA -> advisory IDs
+        self.by_package = {}
+        # severity -> advisory IDs
+        self.by_severity = {}
+        # type -> advisory IDs
+        self.by_type = {}
+        for advisory in advisories:
+            self.add(advisory)
+
+    def add(self, advisory):
+        """add an advisory to the index"""
+        self.advisories[advisory.id] = advisory
+        for nevra in advisory.packages:
+            self.by_package.setdefault(nevra, set()).add(advisory.id)
+        self.by_severity.setdefault(advisory.severity, set()).add(advisory.id)
+        self.by_type.setdefault(advisory.type, set()).add(advisory.id)
+
+    @staticmethod
+    def from_file(connection, path):
+        """return the index of a (possibly compressed) updateinfo.xml file on the host"""
+        return Updateinfo(repodata.advisories(connection, path))
+
+    @staticmethod
+    def from_repo(connection, repo):
+        """return the index of the updateinfo published in the repo (empty if there's none)"""
+        path = repomd_cache().location(connection, repo, "updateinfo")
+        if not path:
+            return Updateinfo()
+        return Updateinfo(repomd_cache().contents(connection, path, repodata.advisories))
+
+    @staticmethod
+    def client_advisory_ids(connection):
+        """return the set of advisory IDs that yum (or dnf) on the client knows about"""
+        _, stdout, _ = connection.exec_command("yum -q updateinfo list all")
+        ids = set()
+        for line in stdout:
+            # installed updates can be preceded with "i"
+            for field in line.split()[:2]:
+                if ADVISORY_PATTERN.match(field):
+                    ids.add(field)
+                    break
+        return ids
+
+    @property
+    def ids(self):
+        """the set of advisory IDs"""
+        return set(self.advisories)
+
+    @property
+    def nevras(self):
+        """the set of package NEVRAs referenced by the advisories"""
+        return set(self.by_package)
+
+    def packages(self, advisory_id):
+        """return the list of package NEVRAs in the advisory"""
+        return self.advisories[advisory_id].packages
+
+    def advisories_for(self, nevra):
+        """return the set of advisory IDs that include the package"""
+        return self.by_package.get(nevra, set())
+
+    def with_severity(self, severity):
+        """return the set of advisory IDs with the given severity (e.g. Important)"""
+        return self.by_severity.get(severity, set())
+
+    def with_type(self, advisory_type):
+        """return the set of advisory IDs of the given type (security, bugfix, enhancement)"""
+        return self.by_type.get(advisory_type, set())
+
+    def diff(self, other):
+        """
+        return the advisory IDs missing in the other index or collection of IDs,
+        and the IDs that only occur there
+        """
+        other_ids = other.ids if isinstance(other, Updateinfo) else set(other)
+        return self.ids - other_ids, other_ids - self.ids
+
+    def __contains__(self, advisory_id):
+        return advisory_id in self.advisories
+
+    def __len__(self):
+        return len(self.advisories)
+
+    def __repr__(self):
+        return "Updateinfo(%d advisories, %d packages)" % (len(self.advisories),
+                                                           len(self.by_package))
@@ -1,11 +1,12 @@
 """ Utility functions """
 
 from configparser import ConfigParser
+from contextlib import ExitStack
+from multiprocessing.pool import ThreadPool
 import os
 import random
 import re
 import string
-import tempfile
 import time
 import urllib3
 import yaml
@@ -13,7 +14,12 @@ import yaml
 import certifi
 from stitches.expect import Expect, ExpectFailed
 
+from rhui3_tests_lib.artifact_cache import artifact_cache
 from rhui3_tests_lib.conmgr import ConMgr, DOMAIN
+from rhui3_tests_lib.probe import Probe
+
+# how much data to read from the source (and write to the targets) at a time in relay_file()
+RELAY_CHUNK_SIZE = 1048576
 
 class Util():
     '''
@@ -107,16 +113,38 @@ class Util():
         If "pedantic", fail if the rpmlist contains one or more packages that are not installed.
         Otherwise, ignore such packages, remove whatever *is* installed (if anything).
         '''
-        installed = [rpm for rpm in rpmlist if connection.recv_exit_status("rpm -q %s" % rpm) == 0]
+        rpms_installed = Probe.rpms_installed(connection, rpmlist)
+        installed = [rpm for rpm in rpmlist if rpms_installed[rpm]]
         if installed:
             Expect.expect_retval(connection, "rpm -e %s" % ' '.join(installed), timeout=60)
         if pedantic and installed != rpmlist:
             raise OSError("%s: not installed, could not remove" % (set(rpmlist) - set(installed)))
 
+    @staticmethod
+    def relay_file(source_connection, source_path, target_connections, target_path):
+        '''
+        Copy a file from a remote host to one or more other remote hosts,
+        writing the data to all the targets as it is read from the source.
+        '''
+        with ExitStack() as files:
+            source_file = files.enter_context(source_connection.sftp.open(source_path, "rb"))
+            source_file.prefetch()
+            target_files = [files.enter_context(target.sftp.open(target_path, "wb"))
+                            for target in target_connections]
+            for target_file in target_files:
+                target_file.set_pipelined(True)
+            chunk = source_file.read(RELAY_CHUNK_SIZE)
+            while chunk:
+                for target_file in target_files:
+                    target_file.write(chunk)
+                chunk = source_file.read(RELAY_CHUNK_SIZE)
+
     @staticmethod
     def install_pkg_from_rhua(rhua_connection, target_connection, pkgpath, allow_update=False):
         '''
         Transfer a package from the RHUA to the target node and install it there.
+        The target can also be a list of connections; the package is then sent to all of them
+        at once and installed on them in parallel.
         '''
         # the package can be an RPM file to install/update using rpm -- typically a RHUI client
         # configuration RPM,
@@ -132,16 +160,36 @@ class Util():
             raise ValueError("%s has an unsupported file extension. Supported extensions are: %s" %\
                              (pkgpath, list(supported_extensions.values())))
 
-        local_file = tempfile.NamedTemporaryFile(delete=False)
-        local_file.close()
-
-        rhua_connection.sftp.get(pkgpath, local_file.name)
-        target_connection.sftp.put(local_file.name, target_file_name)
+        if isinstance(target_connection, list):
+            target_connections = target_connection
+        else:
+            target_connections = [target_connection]
+        Util.relay_file(rhua_connection, pkgpath, target_connections, target_file_name)
 
-        Expect.expect_retval(target_connection, cmd)
+        def _install(connection):
+            Expect.expect_retval(connection, cmd)
+            Expect.expect_retval(connection, "rm -f %s" % target_file_name)
+        if len(target_connections) == 1:
+            _install(target_connections[0])
+            return
+        pool = ThreadPool(len(target_connections))
+        try:
+            pool.map(_install, target_connections)
+        finally:
+            pool.close()
 
-        os.unlink(local_file.name)
-        Expect.expect_retval(target_connection, "rm -f %s" % target_file_name)
+    @staticmethod
+    def install_pkg_on_all_clients(rhua_connection, pkgpath, allow_update=False):
+        '''
+        Transfer a package from the RHUA to all the clients and install it there concurrently.
+        '''
+        clients = [ConMgr.connect(host) for host in ConMgr.get_cli_hostnames(fake=False)]
+        try:
+            if clients:
+                Util.install_pkg_from_rhua(rhua_connection, clients, pkgpath, allow_update)
+        finally:
+            for client in clients:
+                client.disconnect()
 
     @staticmethod
     def get_initial_password(connection):
@@ -257,17 +305,19 @@ class Util():
         '''
         check if the certificate has already expired, return true if so
         '''
-        file_exists = connection.recv_exit_status("test -f %s" % cert) == 0
-        if not file_exists:
+        file_exists, checkend = Probe.run(connection,
+                                          ["test -f %s" % cert,
+                                           "openssl x509 -checkend -noout -in %s" % cert])
+        if not file_exists.success:
             raise OSError("%s does not exist" % cert)
-        return connection.recv_exit_status("openssl x509 -checkend -noout -in %s" % cert) == 1
+        return checkend.exit_code == 1
 
     @staticmethod
     def fetch(connection, source, dest):
         '''
-        fetch a file from the remote host
+        fetch a file from the remote host (through the local artifact cache)
         '''
-        connection.sftp.get(source, dest)
+        artifact_cache().fetch(connection, source, dest)
 
     @staticmethod
     def safe_pulp_repo_name(name):
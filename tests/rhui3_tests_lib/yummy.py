@@ -1,9 +1,9 @@
 """Functions for Yum Commands and Repodata Handling"""
 
 from stitches.expect import Expect
-import xmltodict
 
-from rhui3_tests_lib.rhuimanager_cmdline import RHUIManagerCLI
+from rhui3_tests_lib import repodata
+from rhui3_tests_lib.repomd_cache import repomd_cache
 
 class Yummy():
     """various functions to test yum commands and repodata"""
@@ -11,54 +11,23 @@ class Yummy():
     def repodata_location(connection, repo, datatype):
         """return the path to the repository file (on the RHUA) of the given data type"""
         # data types are : filelists, group, primary, updateinfo etc.
-        base_path = "/var/lib/rhui/remote_share/published/yum/https/repos"
-        relative_path = RHUIManagerCLI.repo_info(connection, repo)["relativepath"]
-        repodata_file = "%s/%s/repodata/repomd.xml" % (base_path, relative_path)
-        _, stdout, _ = connection.exec_command("cat %s " % repodata_file)
-        repodata = xmltodict.parse(stdout.read())
-        location_list = [data["location"]["@href"] for data in repodata["repomd"]["data"] \
-                         if data["@type"] == datatype]
-        if location_list:
-            location = location_list[0]
-            wanted_file = "%s/%s/%s" % (base_path, relative_path, location)
-            return wanted_file
-        return None
+        return repomd_cache().location(connection, repo, datatype)
 
     @staticmethod
     def comps_xml_grouplist(connection, comps_xml, uservisible_only=True):
         """return a sorted list of yum groups in the given comps.xml file"""
         # by default, only groups with <uservisible>true</uservisible> are taken into account,
         # but those "invisible" can be included too, if requested
-        _, stdout, _ = connection.exec_command("cat %s" % comps_xml)
-        comps = xmltodict.parse(stdout.read())
-        # in a multi-group comps.xml file, the groups are in a list,
-        # whereas in a single-group file, the group is just a string
-        if isinstance(comps["comps"]["group"], list):
-            # get a list of name-visibility pairs first
-            group_info = [[group["name"][0], group["uservisible"].lower() == "true"] \
-                          for group in comps["comps"]["group"]]
-            if uservisible_only:
-                grouplist = [group[0] for group in group_info if group[1]]
-            else:
-                grouplist = [group[0] for group in group_info]
-            return sorted(grouplist)
-        if uservisible_only:
-            if comps["comps"]["group"]["uservisible"].lower() == "true":
-                return [comps["comps"]["group"]["name"][0]]
-            return []
-        return [comps["comps"]["group"]["name"][0]]
+        groups = repomd_cache().contents(connection, comps_xml, repodata.groups)
+        return sorted(group.name for group in groups if group.uservisible or not uservisible_only)
 
     @staticmethod
     def comps_xml_langpacks(connection, comps_xml):
         """return a list of name, package tuples for the langpacks from the given comps.xml file"""
         # or None if there are no langpacks
-        _, stdout, _ = connection.exec_command("cat %s" % comps_xml)
-        comps = xmltodict.parse(stdout.read())
-        if comps["comps"]["langpacks"]:
-            names_pkgs = [(match["@name"], match["@install"]) \
-                          for match in comps["comps"]["langpacks"]["match"]]
-            return names_pkgs
-        return None
+        names_pkgs = [tuple(langpack) for langpack in
+                      repomd_cache().contents(connection, comps_xml, repodata.langpacks)]
+        return names_pkgs or None
 
     @staticmethod
     def yum_grouplist(connection):